@@ -0,0 +1,55 @@
+"""
+Build Django's DATABASES entry from a DATABASE_URL.
+
+Supports ``postgres://`` / ``postgresql://`` and ``sqlite:///path`` URLs.
+Query-string parameters (e.g. ``?sslmode=require``) become driver OPTIONS.
+Postgres connections are either kept open per thread (CONN_MAX_AGE with
+health checks) or, with ``pool=True``, shared through psycopg's connection
+pool (Django 5.1+), which needs CONN_MAX_AGE = 0.
+"""
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+ENGINES = {
+    'postgres': 'django.db.backends.postgresql',
+    'postgresql': 'django.db.backends.postgresql',
+    'pgsql': 'django.db.backends.postgresql',
+    'sqlite': 'django.db.backends.sqlite3',
+}
+
+
+def parse_database_url(url, conn_max_age=0, pool=False, pool_min_size=2, pool_max_size=10):
+    parts = urlsplit(url)
+    engine = ENGINES.get(parts.scheme)
+    if engine is None:
+        raise ValueError(f'Unsupported DATABASE_URL scheme: {parts.scheme!r}')
+    options = dict(parse_qsl(parts.query))
+
+    if engine == 'django.db.backends.sqlite3':
+        # sqlite:///relative.db, sqlite:////absolute/path.db, sqlite://:memory:
+        name = parts.netloc if parts.netloc == ':memory:' else unquote(parts.path[1:])
+        return {'ENGINE': engine, 'NAME': name or ':memory:', 'OPTIONS': options}
+
+    config = {
+        'ENGINE': engine,
+        'NAME': unquote(parts.path.lstrip('/')),
+        'USER': unquote(parts.username or ''),
+        'PASSWORD': unquote(parts.password or ''),
+        'HOST': parts.hostname or '',
+        'PORT': str(parts.port or ''),
+        'OPTIONS': options,
+        'CONN_MAX_AGE': conn_max_age,
+        # Reconnect instead of failing a request on a connection the server dropped
+        'CONN_HEALTH_CHECKS': conn_max_age != 0,
+    }
+    if pool:
+        config['CONN_MAX_AGE'] = 0
+        config['CONN_HEALTH_CHECKS'] = False
+        from psycopg_pool import ConnectionPool
+
+        config['OPTIONS']['pool'] = {
+            'min_size': pool_min_size,
+            'max_size': pool_max_size,
+            # Test each connection as it leaves the pool
+            'check': ConnectionPool.check_connection,
+        }
+    return config
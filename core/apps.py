@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connect the signal handlers that maintain the task indexes. caching
+        # goes last so the catalogue version moves after the indexes are updated.
+        from . import facets, recommendations, search  # noqa: F401
+        from . import authentication, caching, realtime, sqlite  # noqa: F401
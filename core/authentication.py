@@ -0,0 +1,158 @@
+"""
+Token authentication with a two-level token -> user cache.
+
+Lookups go to a small in-process LRU first, then the shared Django cache,
+and only then to the Token/User join. Only the user id and the flags
+permission checks need are cached (never password hashes); every other User
+field is deferred and loaded on first use, or all at once with load_user().
+Entries are dropped when the user is saved or the token deleted; the short
+local TTL bounds how long another process can keep serving a user that
+changed elsewhere. The shared tier is skipped when the cache backend is
+per-process, since other processes could not invalidate it.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+DEFAULTS = {
+    'MAX_SIZE': 1024,
+    'LOCAL_TTL': 10,
+    'SHARED_TTL': 300,
+}
+# What a cached credential holds; the rest of the User row is deferred.
+# Kept in model field order, which User.from_db() expects.
+CACHED_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {'id', 'is_active', 'is_staff', 'is_superuser', 'is_activated'}
+)
+# Backends whose entries live in one process and cannot be invalidated by another
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _setting(name):
+    return getattr(settings, 'TOKEN_AUTH_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU whose entries expire after ``ttl`` seconds (or a per-entry ttl)."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LRUCache(_setting('MAX_SIZE'), _setting('LOCAL_TTL'))
+
+
+def _cache_key(token_key):
+    # Never put raw tokens into the shared cache
+    return 'auth:token:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+
+def _shared_cache_enabled():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def invalidate_token(token_key):
+    key = _cache_key(token_key)
+    local_cache.delete(key)
+    cache.delete(key)
+
+
+def invalidate_user(user_id):
+    """Drop cached credentials for a user, e.g. after a queryset.update() on User."""
+    for token_key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(token_key)
+
+
+def load_user(user):
+    """Load the fields an authenticated user left deferred, in one query."""
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for TokenAuthentication that caches token -> user."""
+
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        values = local_cache.get(cache_key)
+        if values is None:
+            shared = _shared_cache_enabled()
+            values = cache.get(cache_key) if shared else None
+            if values is None:
+                values = (
+                    Token.objects.filter(key=key)
+                    .values_list(*(f'user__{name}' for name in CACHED_FIELDS))
+                    .first()
+                )
+                if values is None:
+                    raise exceptions.AuthenticationFailed('Invalid token.')
+                if shared:
+                    cache.set(cache_key, values, _setting('SHARED_TTL'))
+            local_cache.set(cache_key, values)
+
+        # A fresh instance per request, so views may modify request.user.
+        # The token object itself is not needed by any view; skip loading it.
+        user = User.from_db(DEFAULT_DB_ALIAS, CACHED_FIELDS, values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, key
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_credentials(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        user_id = instance.pk
+        transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
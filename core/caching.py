@@ -0,0 +1,109 @@
+"""
+Versioned cache for the task catalogue.
+
+Rendered task pages are cached under the current catalogue version. Any Task
+or Application write bumps the version, which orphans every cached page at
+once instead of tracking which pages a task was on. Pages that carry per-user
+state are additionally keyed by a per-user version that the user's own
+bookmark writes bump. The versions double as the ETag so unchanged pages
+come back as 304s.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Application, Bookmark, Task
+
+CATALOGUE_VERSION_KEY = 'tasks:catalogue:version'
+USER_VERSION_KEY = 'tasks:user:{}:version'
+
+
+def _initial_version():
+    # Seed from the clock so a version lost to eviction never reuses old keys.
+    return int(time.time() * 1000)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def catalogue_version():
+    return _get_version(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    _bump_version(CATALOGUE_VERSION_KEY)
+
+
+def bump_user_version(user_id):
+    _bump_version(USER_VERSION_KEY.format(user_id))
+
+
+def catalogue_cache_key(request, user=None, namespace='tasks'):
+    """
+    Return ``(cache key, ETag)`` for this request at the current catalogue
+    version, scoped to ``user`` when the page carries per-user state.
+    """
+    version = str(catalogue_version())
+    if user is not None:
+        version = f'{version}-{user.pk}-{_get_version(USER_VERSION_KEY.format(user.pk))}'
+    query = sorted(request.query_params.lists())
+    digest = hashlib.md5(f'{request.get_host()}|{query}'.encode()).hexdigest()
+    return f'{namespace}:catalogue:{version}:{digest}', f'"{namespace}-{version}-{digest[:16]}"'
+
+
+def cached_catalogue_response(request, build_response, user=None):
+    """
+    Serve a catalogue page from cache, or build and cache it.
+
+    ``build_response()`` is only called on a miss and must return a 200
+    Response whose data depends on nothing but the query string and, when
+    ``user`` is given, that user.
+    """
+    key, etag = catalogue_cache_key(request, user)
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    data = cache.get(key)
+    if data is None:
+        response = build_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        data = response.data
+        cache.set(key, data, settings.TASK_CATALOGUE_CACHE_TTL)
+    return Response(data, headers={'ETag': etag})
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def invalidate_task_catalogue(sender, raw=False, **kwargs):
+    # Applications change applications_count for everyone, not just the applicant
+    if not raw:
+        transaction.on_commit(bump_catalogue_version)
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_delete, sender=Bookmark)
+def invalidate_user_task_state(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: bump_user_version(instance.user_id))
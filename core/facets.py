@@ -0,0 +1,108 @@
+"""
+Task filtering and facet counts.
+
+Counts per category and location live in TaskFacet and are adjusted by one
+when a task is created, moved or deleted, so the filter sidebar never runs a
+GROUP BY over the task table.
+"""
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Task, TaskFacet
+
+FACETS = ('category', 'location')
+
+
+def _bump(facet, value, delta):
+    if not value:
+        return
+    updated = TaskFacet.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+    if not updated and delta > 0:
+        obj, created = TaskFacet.objects.get_or_create(
+            facet=facet, value=value, defaults={'count': delta}
+        )
+        if not created:
+            TaskFacet.objects.filter(pk=obj.pk).update(count=F('count') + delta)
+
+
+def facet_counts():
+    counts = {facet: {} for facet in FACETS}
+    rows = TaskFacet.objects.filter(count__gt=0).order_by('-count', 'value')
+    for facet, value, count in rows.values_list('facet', 'value', 'count'):
+        counts[facet][value] = count
+    return counts
+
+
+def _parse_budget(params, name):
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        return Decimal(raw)
+    except InvalidOperation:
+        raise ValidationError({name: 'Must be a number.'})
+
+
+def _parse_posted_after(raw):
+    try:
+        value = parse_datetime(raw)
+        if value is None:
+            day = parse_date(raw)
+            value = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({'posted_after': 'Must be an ISO date or datetime.'})
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def filter_tasks(queryset, params):
+    """Apply ?category=, ?location=, ?min_budget=, ?max_budget= and ?posted_after=."""
+    for facet in FACETS:
+        if params.get(facet):
+            queryset = queryset.filter(**{facet: params[facet]})
+    min_budget = _parse_budget(params, 'min_budget')
+    if min_budget is not None:
+        queryset = queryset.filter(budget__gte=min_budget)
+    max_budget = _parse_budget(params, 'max_budget')
+    if max_budget is not None:
+        queryset = queryset.filter(budget__lte=max_budget)
+    if params.get('posted_after'):
+        queryset = queryset.filter(created_at__gt=_parse_posted_after(params['posted_after']))
+    return queryset
+
+
+@receiver(pre_save, sender=Task)
+def remember_task_facets(sender, instance, raw=False, **kwargs):
+    instance._previous_facets = None
+    if not raw and not instance._state.adding and instance.pk:
+        instance._previous_facets = (
+            Task.objects.filter(pk=instance.pk).values(*FACETS).first()
+        )
+
+
+@receiver(post_save, sender=Task)
+def update_task_facets(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_facets', None) or {}
+    for facet in FACETS:
+        old, new = previous.get(facet), getattr(instance, facet)
+        if created or old != new:
+            _bump(facet, old, -1)
+            _bump(facet, new, 1)
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_facets(sender, instance, **kwargs):
+    for facet in FACETS:
+        _bump(facet, getattr(instance, facet), -1)
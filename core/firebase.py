@@ -0,0 +1,154 @@
+"""
+Firebase integration: cached ID-token checks without the Admin SDK.
+
+ID tokens are verified locally with PyJWT against Google's public signing
+keys. The keys are cached for the lifetime Google advertises in
+Cache-Control, and tokens that already verified are remembered (by hash)
+until they expire, so repeat logins cost no network round trip and no
+RSA verification.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import jwt
+import requests
+from cryptography.x509 import load_pem_x509_certificate
+from django.conf import settings
+
+from .authentication import LRUCache
+
+GOOGLE_CERTS_URL = (
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+)
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+DEFAULT_KEYS_MAX_AGE = 3600
+CLOCK_SKEW_SECONDS = 60
+
+
+class InvalidIdToken(Exception):
+    pass
+
+
+# ------------------ PROJECT ------------------
+def _service_account_info():
+    raw = getattr(settings, 'FIREBASE_SERVICE_ACCOUNT', None)
+    if raw:
+        return json.loads(raw)
+    path = getattr(settings, 'FIREBASE_CREDENTIALS_PATH', None)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def get_project_id():
+    project_id = getattr(settings, 'FIREBASE_PROJECT_ID', None)
+    if project_id:
+        return project_id
+    info = _service_account_info()
+    return info.get('project_id') if info else None
+
+
+# ------------------ ID TOKENS ------------------
+def fetch_google_keys():
+    """Return ({kid: PEM certificate}, max_age_seconds) from Google."""
+    response = requests.get(GOOGLE_CERTS_URL, timeout=5)
+    response.raise_for_status()
+    match = MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+    max_age = int(match.group(1)) if match else DEFAULT_KEYS_MAX_AGE
+    return response.json(), max_age
+
+
+class IdTokenVerifier:
+    """
+    Verifies Firebase ID tokens the way firebase_admin.auth.verify_id_token does.
+
+    ``key_fetcher`` returns ``({kid: PEM certificate}, max_age)`` and can be
+    swapped for a local fake key set in tests.
+    """
+
+    def __init__(self, project_id, key_fetcher=fetch_google_keys, max_tokens=4096):
+        self.project_id = project_id
+        self.key_fetcher = key_fetcher
+        self.verified = LRUCache(max_tokens, ttl=0)
+        self._keys = {}
+        self._keys_expire_at = 0
+        self._fetched_at = float('-inf')
+        self._keys_lock = threading.Lock()
+
+    def _public_key(self, kid):
+        with self._keys_lock:
+            now = time.monotonic()
+            # Refetch on expiry, or early (at most once a minute) if Google
+            # rotated in a key we have not seen yet
+            unknown_kid = kid not in self._keys and now - self._fetched_at > 60
+            if now >= self._keys_expire_at or unknown_kid:
+                certificates, max_age = self.key_fetcher()
+                self._keys = {
+                    key_id: load_pem_x509_certificate(pem.encode()).public_key()
+                    for key_id, pem in certificates.items()
+                }
+                self._keys_expire_at = now + max_age
+                self._fetched_at = now
+            key = self._keys.get(kid)
+        if key is None:
+            raise InvalidIdToken('ID token has an unknown key id.')
+        return key
+
+    def verify(self, id_token):
+        if not self.project_id:
+            raise InvalidIdToken('FIREBASE_PROJECT_ID is not configured.')
+        token_hash = hashlib.sha256(id_token.encode()).hexdigest()
+        claims = self.verified.get(token_hash)
+        if claims is not None:
+            return dict(claims)
+
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as exc:
+            raise InvalidIdToken(str(exc)) from exc
+        if header.get('alg') != 'RS256':
+            raise InvalidIdToken('ID token has an unexpected algorithm.')
+
+        try:
+            claims = jwt.decode(
+                id_token,
+                self._public_key(header.get('kid')),
+                algorithms=['RS256'],
+                audience=self.project_id,
+                issuer=f'https://securetoken.google.com/{self.project_id}',
+                leeway=CLOCK_SKEW_SECONDS,
+                options={'require': ['exp', 'iat', 'sub']},
+            )
+        except jwt.PyJWTError as exc:
+            raise InvalidIdToken(str(exc)) from exc
+
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidIdToken('ID token has an invalid subject.')
+        claims['uid'] = subject
+
+        ttl = claims['exp'] - time.time()
+        if ttl > 0:
+            self.verified.set(token_hash, claims, ttl=ttl)
+        return dict(claims)
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            _verifier = IdTokenVerifier(get_project_id())
+        return _verifier
+
+
+def verify_id_token(id_token):
+    return get_verifier().verify(id_token)
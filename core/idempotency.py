@@ -0,0 +1,122 @@
+"""
+``Idempotency-Key`` support for POST endpoints with side effects.
+
+The first request with a given key claims it by inserting an IdempotencyKey
+row, runs the view and stores the response. A retry with the same key and
+body gets the stored response back without the view running again; a retry
+while the first request is still running gets a 409. Server errors release
+the key so the client can try again, and a key whose request never finished
+(the process died) can be taken over once its IDEMPOTENCY_KEY_LEASE lapses. Rows expire after
+IDEMPOTENCY_KEY_TTL seconds and are removed by ``purge_idempotency_keys``.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method}|{request.path}|{body}'.encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """Insert the key row; return None if we own it, else the existing row."""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    locked_until = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE)
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint, expires_at=expires_at,
+                locked_until=locked_until
+            )
+        return None
+    except IntegrityError:
+        pass
+    existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if existing is not None and existing.expires_at <= now:
+        # An expired key is as good as unused
+        existing.delete()
+        return _claim(user, key, fingerprint)
+    if (existing is not None and existing.status_code is None and existing.fingerprint == fingerprint
+            and (existing.locked_until is None or existing.locked_until <= now)):
+        # The request that claimed it never finished; the conditional update
+        # lets only one retry take it over
+        taken = IdempotencyKey.objects.filter(
+            pk=existing.pk, status_code__isnull=True, locked_until=existing.locked_until
+        ).update(locked_until=locked_until)
+        if taken:
+            return None
+        existing.refresh_from_db()
+    return existing
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.status_code is None:
+        return Response(
+            {'error': f'A request with this {HEADER} is still being processed.'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view):
+    """
+    Make a DRF function view safe to retry with an ``Idempotency-Key`` header.
+
+    Apply it below ``@api_view``/``@permission_classes`` so ``request.user``
+    is authenticated; keys are scoped per user. Requests without the header
+    run as before.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = _fingerprint(request)
+        record = _claim(request.user, key, fingerprint)
+        if record is not None:
+            return _replay(record, fingerprint)
+
+        claimed = IdempotencyKey.objects.filter(user=request.user, key=key)
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            claimed.delete()
+            raise
+        if response.status_code >= 500:
+            claimed.delete()
+        else:
+            claimed.update(status_code=response.status_code, response=response.data)
+        return response
+    return wrapper
+
+
+def purge_expired_keys():
+    """Delete expired keys; returns the number removed."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
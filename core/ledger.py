@@ -0,0 +1,158 @@
+"""
+Wallet ledger: every balance change goes through here.
+
+Balances are moved with conditional ``UPDATE ... SET balance = balance - x
+WHERE balance >= x`` statements, so the database decides whether funds are
+available and concurrent debits can never overdraw a wallet. Each movement
+writes its Transaction row in the same database transaction, which keeps
+``balance + held`` equal to credits minus debits. Amounts are Decimals
+rounded to cents; floats are never used.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+
+from .models import Transaction, Wallet, WalletHold
+
+CENT = Decimal('0.01')
+
+
+class InvalidAmount(ValueError):
+    pass
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class HoldNotOpen(Exception):
+    pass
+
+
+def to_amount(value):
+    """Parse a positive money amount into a Decimal with two places."""
+    if isinstance(value, float):
+        value = str(value)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        raise InvalidAmount('Amount must be a number.')
+    if not amount.is_finite() or amount <= 0:
+        raise InvalidAmount('Amount must be greater than zero.')
+    amount = amount.quantize(CENT, rounding=ROUND_HALF_UP)
+    if amount <= 0:
+        raise InvalidAmount('Amount must be at least 0.01.')
+    return amount
+
+
+def to_whole_amount(value):
+    """Like to_amount, for M-Pesa, which only moves whole shillings."""
+    amount = to_amount(value)
+    if amount != amount.to_integral_value():
+        raise InvalidAmount('Amount must be a whole number of shillings.')
+    return amount
+
+
+def _refresh(wallet):
+    wallet.refresh_from_db(fields=['balance', 'held'])
+    return wallet
+
+
+def credit(wallet, amount, description):
+    """Add funds to ``wallet`` and return the Transaction."""
+    amount = to_amount(amount)
+    with transaction.atomic():
+        Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount)
+        entry = Transaction.objects.create(
+            wallet=wallet, amount=amount, transaction_type='credit', description=description
+        )
+        _refresh(wallet)
+    return entry
+
+
+def credit_many(entries):
+    """
+    Apply many credits at once; ``entries`` is ``[(user_id, amount, description)]``.
+
+    All balances move in one UPDATE and the Transaction rows are written with
+    one bulk insert, so settling a batch of payments costs a fixed number of
+    queries.
+    """
+    entries = [(user_id, to_amount(amount), description) for user_id, amount, description in entries]
+    if not entries:
+        return []
+    totals = {}
+    for user_id, amount, _ in entries:
+        totals[user_id] = totals.get(user_id, Decimal('0.00')) + amount
+    with transaction.atomic():
+        wallet_ids = dict(Wallet.objects.filter(user_id__in=totals).values_list('user_id', 'pk'))
+        Wallet.objects.filter(pk__in=wallet_ids.values()).update(balance=F('balance') + Case(
+            *[When(user_id=user_id, then=Value(total)) for user_id, total in totals.items()],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+        return Transaction.objects.bulk_create([
+            Transaction(wallet_id=wallet_ids[user_id], amount=amount,
+                        transaction_type='credit', description=description)
+            for user_id, amount, description in entries if user_id in wallet_ids
+        ])
+
+
+def debit(wallet, amount, description):
+    """Take funds from ``wallet``; raises InsufficientFunds rather than overdraw."""
+    amount = to_amount(amount)
+    with transaction.atomic():
+        updated = Wallet.objects.filter(pk=wallet.pk, balance__gte=amount).update(
+            balance=F('balance') - amount
+        )
+        if not updated:
+            raise InsufficientFunds('Insufficient balance')
+        entry = Transaction.objects.create(
+            wallet=wallet, amount=amount, transaction_type='debit', description=description
+        )
+        _refresh(wallet)
+    return entry
+
+
+def hold(wallet, amount, description):
+    """Reserve funds for a pending payout; capture or release the hold later."""
+    amount = to_amount(amount)
+    with transaction.atomic():
+        updated = Wallet.objects.filter(pk=wallet.pk, balance__gte=amount).update(
+            balance=F('balance') - amount, held=F('held') + amount
+        )
+        if not updated:
+            raise InsufficientFunds('Insufficient balance')
+        wallet_hold = WalletHold.objects.create(wallet=wallet, amount=amount, description=description)
+        _refresh(wallet)
+    return wallet_hold
+
+
+def _close_hold(wallet_hold, status):
+    # Only one caller can move a hold out of 'held'
+    updated = WalletHold.objects.filter(pk=wallet_hold.pk, status='held').update(status=status)
+    if not updated:
+        raise HoldNotOpen(f'Hold {wallet_hold.pk} is no longer open.')
+    wallet_hold.status = status
+
+
+def capture(wallet_hold, description=None):
+    """Turn a hold into a debit and return the Transaction."""
+    with transaction.atomic():
+        _close_hold(wallet_hold, 'captured')
+        Wallet.objects.filter(pk=wallet_hold.wallet_id).update(held=F('held') - wallet_hold.amount)
+        return Transaction.objects.create(
+            wallet_id=wallet_hold.wallet_id,
+            amount=wallet_hold.amount,
+            transaction_type='debit',
+            description=description or wallet_hold.description,
+        )
+
+
+def release(wallet_hold):
+    """Return held funds to the spendable balance."""
+    with transaction.atomic():
+        _close_hold(wallet_hold, 'released')
+        Wallet.objects.filter(pk=wallet_hold.wallet_id).update(
+            balance=F('balance') + wallet_hold.amount, held=F('held') - wallet_hold.amount
+        )
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core import ledger
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure ledger write throughput (credit = UPDATE wallet + INSERT transaction, '
+        'one DB transaction each) from concurrent threads against the configured '
+        'database. Run once per DATABASE_URL to compare backends. Bench users are deleted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=250, help='Writes per thread.')
+        parser.add_argument('--same-wallet', action='store_true',
+                            help='All threads write the same wallet (row contention).')
+
+    def handle(self, *args, **options):
+        threads, writes = options['threads'], options['writes']
+        users = [
+            User.objects.create_user(email=f'bench-writes-{i}@example.invalid', password=None)
+            for i in range(1 if options['same_wallet'] else threads)
+        ]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def work(index):
+            wallet = users[index % len(users)].wallet
+            mine = []
+            try:
+                for _ in range(writes):
+                    started = time.perf_counter()
+                    try:
+                        ledger.credit(wallet, '1.00', 'Benchmark')
+                    except Exception as e:
+                        with lock:
+                            errors.append(e)
+                        continue
+                    mine.append(time.perf_counter() - started)
+            finally:
+                close_old_connections()
+                connection.close()
+            with lock:
+                latencies.extend(mine)
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(work, range(threads)))
+            elapsed = time.perf_counter() - started
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+        latencies.sort()
+        settings_dict = connection.settings_dict
+        self.stdout.write(
+            f"{connection.vendor} (CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}, "
+            f"pool={'pool' in settings_dict['OPTIONS']}): {threads} threads x {writes} writes"
+        )
+        if latencies:
+            self.stdout.write(
+                f'{len(latencies) / elapsed:.0f} writes/s; '
+                f'p50 {1000 * latencies[len(latencies) // 2]:.1f}ms, '
+                f'p95 {1000 * latencies[int(len(latencies) * 0.95)]:.1f}ms'
+            )
+        if errors:
+            self.stdout.write(self.style.WARNING(f'{len(errors)} writes failed, e.g. {errors[0]!r}'))
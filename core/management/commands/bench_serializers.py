@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Message, Task, User
+from core.renderers import ORJSONRenderer
+from core.serializers import MESSAGE_VALUES, TASK_VALUES, MessageSerializer, TaskSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/sec of the DRF serializers + JSONRenderer against the '
+        '.values() fast path + ORJSONRenderer. Seed rows are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        with transaction.atomic():
+            self.seed(rows)
+            tasks = Task.objects.with_user_state(self.user)
+            messages = Message.objects.filter(receiver=self.user)
+            self.compare(
+                'tasks', rows, repeat,
+                lambda: JSONRenderer().render(TaskSerializer(list(tasks), many=True).data),
+                lambda: ORJSONRenderer().render(TASK_VALUES(list(TASK_VALUES.values(tasks)))),
+            )
+            self.compare(
+                'messages', rows, repeat,
+                lambda: JSONRenderer().render(MessageSerializer(list(messages), many=True).data),
+                lambda: ORJSONRenderer().render(MESSAGE_VALUES(list(MESSAGE_VALUES.values(messages)))),
+            )
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        self.user = User.objects.create_user(email='bench-serializers@example.com', password=None)
+        other = User.objects.create_user(email='bench-serializers-2@example.com', password=None)
+        Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}', description='Lorem ipsum dolor sit amet. ' * 20,
+                category=f'category-{i % 12}', skills_required=['python', 'django', f'skill-{i % 40}'],
+                location='Nairobi', budget='1500.00', posted_by=other
+            ) for i in range(rows)
+        ], batch_size=1000)
+        Message.objects.bulk_create([
+            Message(sender=other, receiver=self.user, content=f'Message {i}') for i in range(rows)
+        ], batch_size=1000)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def compare(self, label, rows, repeat, baseline, fast):
+        base_time = self.best_of(repeat, baseline)
+        fast_time = self.best_of(repeat, fast)
+        self.stdout.write(
+            f'{label:>8}: DRF {rows / base_time:>10,.0f} rows/s | '
+            f'fast path {rows / fast_time:>10,.0f} rows/s | {base_time / fast_time:.1f}x'
+        )
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.sqlite import apply_pragmas
+
+SCHEMA = [
+    'CREATE TABLE wallet (id INTEGER PRIMARY KEY, balance REAL NOT NULL)',
+    'CREATE TABLE txn (id INTEGER PRIMARY KEY, wallet_id INTEGER NOT NULL, amount REAL NOT NULL, '
+    'description TEXT NOT NULL, created_at REAL NOT NULL)',
+    'CREATE INDEX txn_wallet_idx ON txn (wallet_id, created_at)',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare SQLite with its default settings against the tuned profile '
+        '(SQLITE_PRAGMAS, BEGIN IMMEDIATE) under concurrent writers and readers. '
+        'Writers update a wallet and insert a transaction; readers page through a '
+        "wallet's transactions. Uses throwaway database files, never the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run.')
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--wallets', type=int, default=100)
+        parser.add_argument('--rows', type=int, default=50000, help='Transactions preloaded.')
+
+    def handle(self, *args, **options):
+        tuned = settings.SQLITE_PRAGMAS or {
+            'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000,
+            'cache_size': -64000, 'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY',
+        }
+        for label, pragmas in (('default', {}), ('tuned', tuned)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.prepare(path, pragmas, options)
+                result = self.run(path, pragmas, options)
+            self.stdout.write(
+                f"{label}: {result['writes'] / result['elapsed']:.0f} writes/s, "
+                f"{result['reads'] / result['elapsed']:.0f} reads/s, "
+                f"write p95 {result['write_p95']:.1f}ms, read p95 {result['read_p95']:.1f}ms, "
+                f"{result['locked']} 'database is locked' errors"
+            )
+
+    @staticmethod
+    def connect(path, pragmas):
+        # Python's default 5 s busy timeout, as Django uses it
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        apply_pragmas(conn, pragmas)
+        return conn
+
+    def prepare(self, path, pragmas, options):
+        conn = self.connect(path, pragmas)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO wallet (id, balance) VALUES (?, 0)',
+                         [(i,) for i in range(options['wallets'])])
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO txn (wallet_id, amount, description, created_at) VALUES (?, 1, ?, ?)',
+            [(i % options['wallets'], 'Seed', now + i) for i in range(options['rows'])],
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def run(self, path, pragmas, options):
+        # The tuned profile also takes the write lock up front, as settings do
+        begin = 'BEGIN IMMEDIATE' if pragmas else 'BEGIN'
+        wallets = options['wallets']
+        stop = threading.Event()
+        lock = threading.Lock()
+        totals = {'writes': 0, 'reads': 0, 'locked': 0}
+        latencies = {'writes': [], 'reads': []}
+
+        def writer(index):
+            conn = self.connect(path, pragmas)
+            done, locked, mine = 0, 0, []
+            while not stop.is_set():
+                wallet_id = (index * 7919 + done + locked) % wallets
+                started = time.perf_counter()
+                try:
+                    conn.execute(begin)
+                    # Read-then-write, like ledger.credit's select and update
+                    conn.execute('SELECT balance FROM wallet WHERE id = ?', (wallet_id,)).fetchone()
+                    conn.execute('UPDATE wallet SET balance = balance + 1 WHERE id = ?', (wallet_id,))
+                    conn.execute('INSERT INTO txn (wallet_id, amount, description, created_at) '
+                                 "VALUES (?, 1, 'Benchmark', ?)", (wallet_id, time.time()))
+                    conn.execute('COMMIT')
+                except sqlite3.OperationalError as e:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    locked += 1
+                    continue
+                mine.append(time.perf_counter() - started)
+                done += 1
+            conn.close()
+            with lock:
+                totals['writes'] += done
+                totals['locked'] += locked
+                latencies['writes'].extend(mine)
+
+        def reader(index):
+            conn = self.connect(path, pragmas)
+            done, locked, mine = 0, 0, []
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.execute(
+                        'SELECT t.id, t.amount, t.description, t.created_at, w.balance FROM txn t '
+                        'JOIN wallet w ON w.id = t.wallet_id WHERE t.wallet_id = ? '
+                        'ORDER BY t.created_at DESC LIMIT 20 OFFSET ?',
+                        ((index + done) % wallets, 20 * (done % 10)),
+                    ).fetchall()
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    locked += 1
+                    continue
+                mine.append(time.perf_counter() - started)
+                done += 1
+            conn.close()
+            with lock:
+                totals['reads'] += done
+                totals['locked'] += locked
+                latencies['reads'].extend(mine)
+
+        threads = (
+            [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+            + [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        )
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        totals['elapsed'] = time.perf_counter() - started
+
+        for kind in ('writes', 'reads'):
+            values = sorted(latencies[kind])
+            totals[kind[:-1] + '_p95'] = 1000 * values[int(len(values) * 0.95)] if values else 0.0
+        return totals
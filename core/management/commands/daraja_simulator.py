@@ -0,0 +1,71 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.simulator import SimulatorConfig, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local Daraja stand-in (OAuth, STK push/query, B2C, async callbacks). '
+        'Set MPESA_BASE_URL=http://<host>:<port> on the app to use it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds added to every API response.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of API calls answered with 503.')
+        parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help='Fraction of payments and payouts whose result is a failure.')
+        parser.add_argument('--callback-delay', type=float, default=1.0,
+                            help='Seconds between an STK push and its callback.')
+        parser.add_argument('--callback-burst', type=int, default=1,
+                            help='Deliver each callback this many times, like Safaricom replays.')
+        parser.add_argument('--callback-url', default=None,
+                            help='Send callbacks here instead of each push\'s CallBackURL '
+                                 '(defaults to MPESA_CALLBACK_URL if set).')
+        parser.add_argument('--b2c-result-url', default=None,
+                            help='Send B2C results here instead of each payment\'s ResultURL '
+                                 '(defaults to MPESA_B2C_RESULT_URL if set).')
+        parser.add_argument('--callback-workers', type=int, default=16)
+        parser.add_argument('--report-every', type=float, default=10.0,
+                            help='Seconds between throughput/latency reports; 0 disables.')
+
+    def handle(self, *args, **options):
+        config = SimulatorConfig(
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            failure_rate=options['failure_rate'],
+            callback_delay=options['callback_delay'],
+            callback_burst=options['callback_burst'],
+            callback_url=options['callback_url'] or settings.MPESA_CALLBACK_URL,
+            b2c_result_url=options['b2c_result_url'] or settings.MPESA_B2C_RESULT_URL,
+            callback_workers=options['callback_workers'],
+        )
+        server, simulator = make_server(options['host'], options['port'], config)
+        self.stdout.write(self.style.SUCCESS(
+            f'Daraja simulator listening on http://{options["host"]}:{server.server_port}'
+        ))
+
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(options['report_every']):
+                for line in simulator.report():
+                    self.stdout.write(line)
+
+        if options['report_every'] > 0:
+            threading.Thread(target=report, daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+            for line in simulator.report():
+                self.stdout.write(line)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.payments import fail_stale, process_batch, process_callbacks
+
+
+class Command(BaseCommand):
+    help = (
+        'Send queued M-Pesa STK pushes to Daraja and apply stored callbacks. '
+        'Runs until stopped unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Daraja calls in flight at once.')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help="Seconds after which a 'processing' request is failed.")
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            fail_stale(options['stale_after'])
+            handled = process_batch(options['batch_size'], options['concurrency'])
+            handled += process_callbacks(options['batch_size'], options['concurrency'])
+            total += handled
+            if handled:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} payment requests and callbacks'))
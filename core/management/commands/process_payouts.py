@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mpesa import RateLimiter, get_client
+from core.payouts import Throughput, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Send queued withdrawals to M-Pesa B2C. Runs until stopped unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='B2C requests in flight at once.')
+        parser.add_argument('--rate', type=float, default=10.0,
+                            help='Maximum B2C requests per second (Daraja quota); 0 for no limit.')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+
+    def handle(self, *args, **options):
+        limiter = RateLimiter(options['rate'], burst=options['concurrency'])
+        throughput = Throughput()
+        while True:
+            claimed, accepted = process_batch(options['batch_size'], options['concurrency'], limiter)
+            if claimed:
+                throughput.add(claimed, accepted)
+                latency = get_client().metrics.snapshot().get('b2c', {})
+                self.stdout.write(
+                    f"{throughput.summary()}; B2C avg {latency.get('avg_ms')}ms, p95 {latency.get('p95_ms')}ms"
+                )
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(throughput.summary()))
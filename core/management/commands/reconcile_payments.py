@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.payments import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Query Daraja for STK pushes whose callback never arrived and settle them. '
+        'Runs every --interval seconds unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='STK queries in flight at once.')
+        parser.add_argument('--rate', type=float, default=5.0,
+                            help='Maximum STK queries per second (Daraja quota); 0 for no limit.')
+        parser.add_argument('--min-age', type=int, default=120,
+                            help='Seconds to wait for the callback before querying.')
+        parser.add_argument('--recheck-after', type=int, default=60,
+                            help='Seconds before querying the same push again.')
+        parser.add_argument('--expire-after', type=int, default=3600,
+                            help='Seconds after which an unanswered push is failed.')
+        parser.add_argument('--interval', type=float, default=60.0)
+        parser.add_argument('--once', action='store_true', help='Run one pass and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            # Keep draining while full batches come back
+            while True:
+                checked, settled = reconcile(
+                    options['batch_size'], options['concurrency'], options['rate'],
+                    options['min_age'], options['recheck_after'], options['expire_after'],
+                )
+                if checked:
+                    self.stdout.write(f'Checked {checked} pending payments, settled {settled}')
+                if checked < options['batch_size']:
+                    break
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'SQLite housekeeping: checkpoint and truncate the WAL, refresh query planner '
+        'statistics, and reclaim free pages. Runs all steps unless some are selected.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkpoint', action='store_true', help='PRAGMA wal_checkpoint(TRUNCATE).')
+        parser.add_argument('--analyze', action='store_true', help='ANALYZE, then PRAGMA optimize.')
+        parser.add_argument('--vacuum', action='store_true', help='PRAGMA incremental_vacuum.')
+        parser.add_argument('--vacuum-pages', type=int, default=0,
+                            help='Free pages to reclaim per run; 0 reclaims all.')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='Switch auto_vacuum to INCREMENTAL. Rewrites the whole file '
+                                 'with VACUUM once, so run it during a quiet period.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'The default database is {connection.vendor}, not SQLite.')
+        run_all = not (options['checkpoint'] or options['analyze'] or options['vacuum']
+                       or options['enable_incremental_vacuum'])
+
+        with connection.cursor() as cursor:
+            if options['enable_incremental_vacuum']:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+                self.stdout.write('auto_vacuum set to INCREMENTAL')
+
+            if run_all or options['vacuum']:
+                cursor.execute('PRAGMA auto_vacuum')
+                if cursor.fetchone()[0] != 2:
+                    self.stdout.write('Incremental vacuum skipped: auto_vacuum is not INCREMENTAL '
+                                      '(see --enable-incremental-vacuum)')
+                else:
+                    cursor.execute('PRAGMA freelist_count')
+                    before = cursor.fetchone()[0]
+                    pages = options['vacuum_pages']
+                    cursor.execute(f'PRAGMA incremental_vacuum({pages})' if pages else 'PRAGMA incremental_vacuum')
+                    cursor.fetchall()
+                    cursor.execute('PRAGMA freelist_count')
+                    self.stdout.write(f'Reclaimed {before - cursor.fetchone()[0]} free pages')
+
+            if run_all or options['analyze']:
+                cursor.execute('ANALYZE')
+                cursor.execute('PRAGMA optimize')
+                self.stdout.write('Planner statistics updated')
+
+            # Last, so the WAL written by the steps above is folded in too
+            if run_all or options['checkpoint']:
+                cursor.execute('PRAGMA journal_mode')
+                if cursor.fetchone()[0].lower() != 'wal':
+                    self.stdout.write('Checkpoint skipped: database is not in WAL mode')
+                else:
+                    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                    busy, log_frames, checkpointed = cursor.fetchone()
+                    self.stdout.write(
+                        f'WAL checkpoint: {checkpointed}/{log_frames} frames'
+                        + (' (busy: readers still active)' if busy else '')
+                    )
+
+        self.stdout.write(self.style.SUCCESS('SQLite maintenance complete'))
@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# The DDL and documents are inlined as they were when this migration was
+# written; core.search may change without rewriting history.
+FTS_TABLE = 'core_task_fts'
+PG_TABLE = 'core_task_search'
+
+
+def _document(task):
+    skills = task.skills_required or []
+    if not isinstance(skills, list):
+        skills = [skills]
+    return [task.title, task.description, task.category, ' '.join(str(s) for s in skills)]
+
+
+def create_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor not in ('sqlite', 'postgresql'):
+        return
+    Task = apps.get_model('core', 'Task')
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, description, category, skills, tokenize='porter unicode61')"
+            )
+            insert = (
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, category, skills) "
+                "VALUES (%s, %s, %s, %s, %s)"
+            )
+        else:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+                "task_id bigint PRIMARY KEY REFERENCES core_task(id) ON DELETE CASCADE, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_gin ON {PG_TABLE} USING GIN (document)"
+            )
+            insert = (
+                f"INSERT INTO {PG_TABLE} (task_id, document) VALUES (%s, "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'D') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'B')) "
+                "ON CONFLICT (task_id) DO UPDATE SET document = EXCLUDED.document"
+            )
+        for task in Task.objects.using(conn.alias).iterator(chunk_size=500):
+            cursor.execute(insert, [task.pk, *_document(task)])
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif conn.vendor == 'postgresql':
+            cursor.execute(f"DROP TABLE IF EXISTS {PG_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
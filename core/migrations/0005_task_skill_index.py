@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_skills(skills):
+    # Frozen copy of core.models.normalize_skills at the time of this migration
+    if not isinstance(skills, list):
+        return []
+    normalized = {str(skill).strip().lower()[:100] for skill in skills}
+    normalized.discard('')
+    return sorted(normalized)
+
+
+def backfill_skill_index(apps, schema_editor):
+    Task = apps.get_model('core', 'Task')
+    TaskSkill = apps.get_model('core', 'TaskSkill')
+    db = schema_editor.connection.alias
+    rows = []
+    for task_id, skills in Task.objects.using(db).values_list('id', 'skills_required').iterator():
+        rows.extend(TaskSkill(task_id=task_id, skill=skill) for skill in normalize_skills(skills))
+    TaskSkill.objects.using(db).bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_task_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskSkill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skill', models.CharField(max_length=100)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skill_index', to='core.task')),
+            ],
+            options={
+                'unique_together': {('skill', 'task')},
+            },
+        ),
+        migrations.RunPython(backfill_skill_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:27
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_facets(apps, schema_editor):
+    Task = apps.get_model('core', 'Task')
+    TaskFacet = apps.get_model('core', 'TaskFacet')
+    db = schema_editor.connection.alias
+    rows = []
+    for facet in ('category', 'location'):
+        counts = (
+            Task.objects.using(db).exclude(**{facet: ''})
+            .values_list(facet).annotate(count=Count('id'))
+        )
+        rows.extend(TaskFacet(facet=facet, value=value, count=count) for value, count in counts)
+    TaskFacet.objects.using(db).bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_task_skill_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Category'), ('location', 'Location')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='task_category_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['location', 'created_at', 'id'], name='task_location_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['budget'], name='task_budget_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='taskfacet',
+            unique_together={('facet', 'value')},
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    Message = apps.get_model('core', 'Message')
+    db = schema_editor.connection.alias
+    conversations = {}
+    messages = Message.objects.using(db).order_by('timestamp', 'id')
+    for message in messages.iterator():
+        pair = tuple(sorted((message.sender_id, message.receiver_id)))
+        conversation = conversations.get(pair)
+        if conversation is None:
+            conversation = Conversation.objects.using(db).create(
+                user_low_id=pair[0], user_high_id=pair[1]
+            )
+            conversations[pair] = conversation
+        conversation.last_message_id = message.id
+        conversation.updated_at = message.timestamp
+        Message.objects.using(db).filter(pk=message.pk).update(conversation=conversation)
+    for conversation in conversations.values():
+        conversation.save(using=db, update_fields=['last_message', 'updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_task_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='core.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='msg_conv_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'receiver', 'read'], name='msg_conv_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_low', 'updated_at', 'id'], name='conv_low_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_high', 'updated_at', 'id'], name='conv_high_inbox_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversation',
+            unique_together={('user_low', 'user_high')},
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
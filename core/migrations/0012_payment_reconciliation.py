@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_mpesa_callbacks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentrequest',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='paymentrequest',
+            index=models.Index(fields=['status', 'last_checked_at'], name='payreq_reconcile_idx'),
+        ),
+    ]
@@ -1,33 +1,75 @@
-from django.db import models
+import re
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BigIntegerField, Count, Exists, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Substr
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 import uuid
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
+    MAX_SUFFIX_DIGITS = 9
+
+    def allocate_username(self, base):
+        """
+        Return ``base`` or ``base_<n>`` one above the highest numeric suffix in use.
+
+        One aggregate query, so the cost does not grow with the number of
+        existing collisions; suffixes like ``_007`` count by their value.
+        Suffixes longer than MAX_SUFFIX_DIGITS (which users can pick through
+        their email address) are ignored rather than overflowing the cast.
+        """
+        taken = (
+            self.model.objects.filter(username__startswith=base)
+            .filter(Q(username=base) | Q(
+                username__regex=rf'^{re.escape(base)}_[0-9]{{1,{self.MAX_SUFFIX_DIGITS}}}$'
+            ))
+            .aggregate(
+                exists=Count('pk'),
+                highest=Max(Cast(Substr('username', len(base) + 2), BigIntegerField()),
+                            filter=~Q(username=base)),
+            )
+        )
+        if not taken['exists']:
+            return base
+        return f"{base}_{(taken['highest'] or 0) + 1}"
 
     def _create_user(self, email, password, **extra_fields):
         if not email:
             raise ValueError('Email is required')
         email = self.normalize_email(email)
-        
-        # Auto-generate a unique username from email
+
         username = extra_fields.pop('username', None)
-        if not username:
-            username_base = email.split('@')[0]
-            username = username_base
-            counter = 1
-            # Ensure username is unique
-            while self.model.objects.filter(username=username).exists():
-                username = f"{username_base}_{counter}"
-                counter += 1
-        
-        user = self.model(username=username, email=email, **extra_fields)
+        if username:
+            user = self.model(username=username, email=email, **extra_fields)
+            user.set_password(password)
+            user.save(using=self._db)
+            return user
+
+        # Auto-generate a unique username from email. A concurrent signup can
+        # take the same name between lookup and insert, so retry on conflict.
+        username_base = email.split('@')[0]
+        user = self.model(email=email, **extra_fields)
         user.set_password(password)
-        user.save(using=self._db)
-        return user
+        for attempt in range(5):
+            if attempt == 0:
+                user.username = self.allocate_username(username_base)
+            else:
+                # Lost a race for that name: step off the counter instead of
+                # recomputing the same candidate
+                user.username = f"{username_base}_{uuid.uuid4().hex[:8]}"
+            try:
+                with transaction.atomic(using=self._db):
+                    user.save(using=self._db, force_insert=True)
+                return user
+            except IntegrityError:
+                if self.model.objects.filter(email=email).exists():
+                    raise
+                user.pk = None
+        raise IntegrityError(f"Could not allocate a username for {email}")
 
     def create_user(self, email, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', False)
@@ -69,6 +111,22 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
 
 
+class TaskQuerySet(models.QuerySet):
+    def with_user_state(self, user):
+        """Annotate is_bookmarked, has_applied and applications_count in the same SELECT."""
+        applications = (
+            Application.objects.filter(task=OuterRef('pk'))
+            .order_by().values('task').annotate(count=Count('*')).values('count')
+        )
+        return self.annotate(
+            is_bookmarked=Exists(Bookmark.objects.filter(user=user, task=OuterRef('pk'))),
+            has_applied=Exists(Application.objects.filter(freelancer=user, task=OuterRef('pk'))),
+            applications_count=Coalesce(
+                Subquery(applications, output_field=IntegerField()), Value(0)
+            ),
+        )
+
+
 class Task(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -79,6 +137,49 @@ class Task(models.Model):
     posted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posted_tasks')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='task_created_keyset_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='task_category_keyset_idx'),
+            models.Index(fields=['location', 'created_at', 'id'], name='task_location_keyset_idx'),
+            models.Index(fields=['budget'], name='task_budget_idx'),
+        ]
+
+
+class TaskSkill(models.Model):
+    """Inverted index row: one per (skill, task), maintained from Task signals."""
+    skill = models.CharField(max_length=100)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='skill_index')
+
+    class Meta:
+        unique_together = ('skill', 'task')
+
+
+class TaskFacet(models.Model):
+    """Precomputed task count per category/location, maintained from Task signals."""
+    FACET_CHOICES = [
+        ('category', 'Category'),
+        ('location', 'Location'),
+    ]
+
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+
+
+def normalize_skills(skills):
+    """Lower-case, de-duplicated skill names from a JSON skills list."""
+    if not isinstance(skills, list):
+        return []
+    normalized = {str(skill).strip().lower()[:100] for skill in skills}
+    normalized.discard('')
+    return sorted(normalized)
+
 
 class Application(models.Model):
     freelancer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='applications')
@@ -96,13 +197,60 @@ class Bookmark(models.Model):
         unique_together = ('user', 'task')
 
 
+class ConversationManager(models.Manager):
+    def for_pair(self, user_id, other_id):
+        """Get or create the conversation between two users, in either order."""
+        low, high = sorted((user_id, other_id))
+        conversation, _ = self.get_or_create(user_low_id=low, user_high_id=high)
+        return conversation
+
+    def for_user(self, user):
+        return self.filter(Q(user_low=user) | Q(user_high=user))
+
+
+class Conversation(models.Model):
+    """One row per pair of users who have exchanged messages (user_low.id < user_high.id)."""
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    updated_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ConversationManager()
+
+    class Meta:
+        unique_together = ('user_low', 'user_high')
+        indexes = [
+            models.Index(fields=['user_low', 'updated_at', 'id'], name='conv_low_inbox_idx'),
+            models.Index(fields=['user_high', 'updated_at', 'id'], name='conv_high_inbox_idx'),
+        ]
+
+    def partner_id(self, user):
+        return self.user_high_id if self.user_low_id == user.pk else self.user_low_id
+
+
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name='messages'
+    )
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='msg_conv_keyset_idx'),
+            models.Index(fields=['conversation', 'receiver', 'read'], name='msg_conv_unread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.conversation_id is None:
+            self.conversation = Conversation.objects.for_pair(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
+
 
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -110,11 +258,18 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notif_user_keyset_idx'),
+        ]
+
 
 # =============== WALLET MODELS (NEW - ADDED BELOW YOUR EXISTING CODE) ===============
 class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # Funds reserved by open holds; not spendable, not yet debited
+    held = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
 
     def __str__(self):
         return f"{self.user.email} - KES {self.balance}"
@@ -132,12 +287,153 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'created_at', 'id'], name='txn_wallet_keyset_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - KES {self.amount}"
 
 
+class WalletHold(models.Model):
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('captured', 'Captured'),
+        ('released', 'Released'),
+    ]
+
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='holds')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.status} hold - KES {self.amount}"
+
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of a POST made with an ``Idempotency-Key`` header."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # While running, a retry may take the key over after this (the first process died)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+
+class PaymentRequest(models.Model):
+    """An STK push queued by the API and sent to Daraja by the payment worker."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('sent', 'Sent'),            # STK push accepted, waiting for the callback
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_requests')
+    phone_number = models.CharField(max_length=12)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    account_reference = models.CharField(max_length=20)
+    description = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    checkout_request_id = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    merchant_request_id = models.CharField(max_length=100, blank=True)
+    result_code = models.IntegerField(null=True, blank=True)
+    result_desc = models.CharField(max_length=255, blank=True)
+    # Last STK query made by the reconciler for a push whose callback is missing
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payreq_queue_idx'),
+            models.Index(fields=['status', 'last_checked_at'], name='payreq_reconcile_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account_reference} - {self.status}"
+
+
+class MpesaCallback(models.Model):
+    """A raw STK callback, stored on receipt and applied by the payment worker."""
+    checkout_request_id = models.CharField(max_length=100, db_index=True)
+    result_code = models.IntegerField(null=True, blank=True)
+    result_desc = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='mpesa_cb_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.checkout_request_id} - {self.result_code}"
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+
+class Payout(models.Model):
+    """A withdrawal paid out through M-Pesa B2C; its funds sit in ``hold`` until settled."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('sent', 'Sent'),            # accepted by Daraja, waiting for the result
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts')
+    hold = models.OneToOneField(WalletHold, on_delete=models.PROTECT, related_name='payout')
+    phone_number = models.CharField(max_length=12)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    originator_conversation_id = models.CharField(max_length=64, unique=True, default=new_conversation_id)
+    conversation_id = models.CharField(max_length=100, blank=True)
+    transaction_id = models.CharField(max_length=50, blank=True)
+    result_code = models.IntegerField(null=True, blank=True)
+    result_desc = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payout_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.phone_number} - KES {self.amount} - {self.status}"
+
+
 # Auto-create wallet when user is created
 @receiver(post_save, sender=User)
 def create_user_wallet(sender, instance, created, **kwargs):
     if created:
-        Wallet.objects.create(user=instance)
\ No newline at end of file
+        Wallet.objects.create(user=instance)
+
+
+# Keep the conversation inbox ordering and preview current
+@receiver(post_save, sender=Message)
+def update_conversation(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Conversation.objects.filter(pk=instance.conversation_id).update(
+            last_message=instance, updated_at=instance.timestamp
+        )
@@ -1,41 +1,295 @@
 # core/mpesa.py
-import requests
+"""
+Safaricom Daraja (M-Pesa) API client.
+
+One DarajaClient per process holds a pooled keep-alive session and the OAuth
+token, which is reused until shortly before it expires instead of being
+fetched for every call. Every call has connect/read timeouts, bounded retries
+with exponential backoff, and its latency recorded in ``client.metrics``.
+"""
 import base64
-import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
 from datetime import datetime
+from decimal import Decimal
+
+import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Refresh the token this many seconds before Daraja says it expires
+TOKEN_REFRESH_MARGIN = 60
+# Statuses worth retrying; anything else is returned or raised at once
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A POST is only retried when it cannot have reached Daraja's handler
+SAFE_POST_RETRY_STATUSES = {429, 503}
+# STK query error code for a push the customer has not answered yet
+PENDING_ERROR_CODE = '500.001.1001'
+
+
+def shillings(amount):
+    """Daraja takes whole shillings; refuse to drop cents silently."""
+    amount = Decimal(str(amount))
+    if amount != amount.to_integral_value():
+        raise ValueError(f'M-Pesa amounts must be whole shillings, got {amount}')
+    return int(amount)
+
+
+class DarajaError(Exception):
+    def __init__(self, message, status_code=None, payload=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = payload
+
+
+class CallMetrics:
+    """Per-endpoint call counts and latency, kept in memory."""
+
+    def __init__(self, samples=500):
+        self._lock = threading.Lock()
+        self._calls = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._latencies = defaultdict(lambda: deque(maxlen=samples))
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self._calls[name] += 1
+            if not ok:
+                self._errors[name] += 1
+            self._latencies[name].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for name, calls in self._calls.items():
+                latencies = sorted(self._latencies[name])
+                result[name] = {
+                    'calls': calls,
+                    'errors': self._errors[name],
+                    'avg_ms': round(1000 * sum(latencies) / len(latencies), 1),
+                    'p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1),
+                    'max_ms': round(1000 * latencies[-1], 1),
+                }
+            return result
+
+
+class DarajaClient:
+    def __init__(self, base_url, consumer_key, consumer_secret, shortcode, passkey, callback_url,
+                 timeout=(3.05, 15), max_retries=2, backoff=0.5, pool_size=10, session=None, b2c=None):
+        self.base_url = base_url.rstrip('/')
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.callback_url = callback_url
+        # initiator_name, security_credential, shortcode, result_url, timeout_url
+        self.b2c = b2c or {}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = CallMetrics()
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+    # ------------------ TRANSPORT ------------------
+    def _sleep_before_retry(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random() / 2))
+
+    def _send(self, name, method, path, **kwargs):
+        """Send one request with retries; returns the final requests.Response."""
+        url = f'{self.base_url}{path}'
+        retry_statuses = RETRY_STATUSES if method == 'GET' else SAFE_POST_RETRY_STATUSES
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as exc:
+                self.metrics.record(name, time.monotonic() - started, ok=False)
+                # Once connected, a POST may have been processed; never resend it
+                retryable = method == 'GET' or isinstance(exc, requests.ConnectTimeout)
+                if retryable and attempt < self.max_retries:
+                    logger.warning('Daraja %s failed (%s), retrying', name, exc)
+                    self._sleep_before_retry(attempt)
+                    attempt += 1
+                    continue
+                raise DarajaError(f'Daraja {name} request failed: {exc}') from exc
+
+            elapsed = time.monotonic() - started
+            self.metrics.record(name, elapsed, ok=response.status_code < 400)
+            logger.info('Daraja %s -> %s in %.0fms', name, response.status_code, elapsed * 1000)
+            if response.status_code in retry_statuses and attempt < self.max_retries:
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+            return response
+
+    @staticmethod
+    def _json(name, response):
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        if response.status_code >= 400 or payload is None:
+            message = (payload or {}).get('errorMessage') or response.text[:200]
+            raise DarajaError(
+                f'Daraja {name} returned {response.status_code}: {message}',
+                status_code=response.status_code, payload=payload
+            )
+        return payload
+
+    # ------------------ AUTH ------------------
+    def access_token(self):
+        """Return a cached OAuth token, fetching a new one near expiry."""
+        with self._token_lock:
+            if self._token is None or time.monotonic() >= self._token_expires_at:
+                response = self._send(
+                    'oauth', 'GET', '/oauth/v1/generate',
+                    params={'grant_type': 'client_credentials'},
+                    auth=(self.consumer_key, self.consumer_secret),
+                )
+                payload = self._json('oauth', response)
+                expires_in = int(payload.get('expires_in', 3599))
+                self._token = payload['access_token']
+                self._token_expires_at = time.monotonic() + max(0, expires_in - TOKEN_REFRESH_MARGIN)
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+
+    def call(self, name, path, payload):
+        """POST ``payload`` to a Daraja API and return the decoded response."""
+        response = self._send(name, 'POST', path, json=payload,
+                              headers={'Authorization': f'Bearer {self.access_token()}'})
+        if response.status_code == 401:
+            # Token revoked or expired early; fetch a fresh one and try once more
+            self.invalidate_token()
+            response = self._send(name, 'POST', path, json=payload,
+                                  headers={'Authorization': f'Bearer {self.access_token()}'})
+        return self._json(name, response)
+
+    # ------------------ APIS ------------------
+    def password(self, timestamp):
+        return base64.b64encode(
+            (self.shortcode + self.passkey + timestamp).encode()
+        ).decode('utf-8')
+
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc):
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        return self.call('stk_push', '/mpesa/stkpush/v1/processrequest', {
+            "BusinessShortCode": self.shortcode,
+            "Password": self.password(timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": shillings(amount),
+            "PartyA": phone_number,
+            "PartyB": self.shortcode,
+            "PhoneNumber": phone_number,
+            "CallBackURL": self.callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": transaction_desc
+        })
+
+    def stk_query(self, checkout_request_id):
+        """
+        Return Daraja's status for an STK push.
+
+        A push the customer has not answered yet comes back as a DarajaError
+        whose ``payload['errorCode']`` is PENDING_ERROR_CODE.
+        """
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        return self.call('stk_query', '/mpesa/stkpushquery/v1/query', {
+            "BusinessShortCode": self.shortcode,
+            "Password": self.password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id
+        })
+
+    def b2c_payment(self, originator_conversation_id, phone_number, amount, remarks, occasion=''):
+        """Send money to a customer; the outcome arrives later at the B2C result URL."""
+        b2c = self.b2c
+        return self.call('b2c', '/mpesa/b2c/v3/paymentrequest', {
+            "OriginatorConversationID": originator_conversation_id,
+            "InitiatorName": b2c['initiator_name'],
+            "SecurityCredential": b2c['security_credential'],
+            "CommandID": "BusinessPayment",
+            "Amount": shillings(amount),
+            "PartyA": b2c['shortcode'],
+            "PartyB": phone_number,
+            "Remarks": remarks,
+            "QueueTimeOutURL": b2c['timeout_url'],
+            "ResultURL": b2c['result_url'],
+            "Occasion": occasion
+        })
+
+
+class RateLimiter:
+    """Token bucket shared by threads: at most ``rate`` acquisitions per second."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DarajaClient(
+                base_url=settings.MPESA_BASE_URL,
+                consumer_key=settings.MPESA_CONSUMER_KEY,
+                consumer_secret=settings.MPESA_CONSUMER_SECRET,
+                shortcode=settings.MPESA_SHORTCODE,
+                passkey=settings.MPESA_PASSKEY,
+                callback_url=settings.MPESA_CALLBACK_URL,
+                timeout=(settings.MPESA_CONNECT_TIMEOUT, settings.MPESA_READ_TIMEOUT),
+                max_retries=settings.MPESA_MAX_RETRIES,
+                b2c={
+                    'initiator_name': settings.MPESA_B2C_INITIATOR_NAME,
+                    'security_credential': settings.MPESA_B2C_SECURITY_CREDENTIAL,
+                    'shortcode': settings.MPESA_B2C_SHORTCODE,
+                    'result_url': settings.MPESA_B2C_RESULT_URL,
+                    'timeout_url': settings.MPESA_B2C_TIMEOUT_URL,
+                },
+            )
+        return _client
 
-def get_mpesa_access_token():
-    consumer_key = settings.MPESA_CONSUMER_KEY
-    consumer_secret = settings.MPESA_CONSUMER_SECRET
-    api_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials" if not settings.DEBUG else "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    
-    r = requests.get(api_url, auth=(consumer_key, consumer_secret))
-    return r.json().get('access_token')
 
 def lipa_na_mpesa_online(phone_number, amount, account_reference, transaction_desc):
-    access_token = get_mpesa_access_token()
-    api_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    password = base64.b64encode(
-        (settings.MPESA_SHORTCODE + settings.MPESA_PASSKEY + timestamp).encode()
-    ).decode('utf-8')
-
-    payload = {
-        "BusinessShortCode": settings.MPESA_SHORTCODE,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": int(amount),
-        "PartyA": phone_number,
-        "PartyB": settings.MPESA_SHORTCODE,
-        "PhoneNumber": phone_number,
-        "CallBackURL": settings.MPESA_CALLBACK_URL,
-        "AccountReference": account_reference,
-        "TransactionDesc": transaction_desc
-    }
-
-    response = requests.post(api_url, json=payload, headers=headers)
-    return response.json()
\ No newline at end of file
+    return get_client().stk_push(phone_number, amount, account_reference, transaction_desc)
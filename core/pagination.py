@@ -0,0 +1,166 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination ordered by (<ordering_field>, id).
+
+    The cursor is an opaque token holding the sort key of the last row served,
+    so every page is one range scan on the (ordering_field, id) index no matter
+    how deep the client pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering_field = 'created_at'
+    descending = True
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering_field=None, descending=None, base_url=None):
+        if ordering_field is not None:
+            self.ordering_field = ordering_field
+        if descending is not None:
+            self.descending = descending
+        # Where the next link points; defaults to the current request's URL
+        self.base_url = base_url
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_cursor = None
+
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.ordering_field}', f'{prefix}id')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, pk = cursor
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.ordering_field}__{lookup}': value}) |
+                Q(**{self.ordering_field: value, f'id__{lookup}': pk})
+            )
+
+        # One extra row tells us whether there is a next page without a COUNT(*).
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_cursor = self.encode_cursor(rows[-1])
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or 20
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                page_size = int(raw)
+            except ValueError:
+                pass
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.base_url or self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def encode_cursor(self, row):
+        if isinstance(row, dict):
+            value, pk = row[self.ordering_field], row['id']
+        else:
+            value, pk = getattr(row, self.ordering_field), row.pk
+        raw = f'{value.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode()
+            value, pk = raw.rsplit('|', 1)
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+
+def paginate(request, queryset, serialize, ordering_field='created_at', descending=True, base_url=None):
+    """Paginate a function-based list view and return the DRF response."""
+    paginator = KeysetPagination(ordering_field=ordering_field, descending=descending, base_url=base_url)
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serialize(page))
+
+
+def paginate_ranked(request, fetch, serialize):
+    """
+    Paginate results that have no stable sort key (e.g. search relevance).
+
+    ``fetch(limit, offset)`` returns the rows for one window; the next link
+    carries the offset of the following window.
+    """
+    paginator = KeysetPagination()
+    page_size = paginator.get_page_size(request)
+    try:
+        offset = max(0, int(request.query_params.get('offset', 0)))
+    except ValueError:
+        offset = 0
+
+    rows = fetch(page_size + 1, offset)
+    next_link = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        url = request.build_absolute_uri()
+        next_link = replace_query_param(url, 'offset', offset + page_size)
+    return Response({
+        'next': next_link,
+        'results': serialize(rows),
+    })
+
+
+def filter_since(queryset, request, ordering_field='created_at'):
+    """
+    Keep only rows newer than the ?since= watermark.
+
+    The watermark is either a row id or an ISO timestamp compared against
+    ``ordering_field``.
+    """
+    since = request.query_params.get('since', '').strip()
+    if since.isdigit():
+        return queryset.filter(id__gt=int(since))
+    try:
+        value = parse_datetime(since)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({'since': 'Must be a row id or an ISO timestamp.'})
+    return queryset.filter(**{f'{ordering_field}__gt': value})
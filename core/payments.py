@@ -0,0 +1,301 @@
+"""
+Queued STK pushes.
+
+The API only records a PaymentRequest and answers 202; the
+``process_payment_requests`` worker sends the queued pushes to Daraja with
+bounded concurrency, so slow Safaricom calls never hold a web worker. Status
+changes are published to the user's realtime channel (event type
+``payment``) and can also be polled from the payment request endpoint.
+
+Daraja's callbacks are stored as MpesaCallback rows and acknowledged at
+once; the same worker applies them in batches, confirming every reported
+success with an STK query because the callback URL is public.
+``reconcile_payments`` settles pushes whose callback was lost by querying
+Daraja directly.
+"""
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import ledger
+from .authentication import invalidate_user
+from .models import MpesaCallback, PaymentRequest, User
+from .mpesa import PENDING_ERROR_CODE, DarajaError, RateLimiter, get_client
+from .realtime import publish
+from .serializers import PaymentRequestSerializer
+
+logger = logging.getLogger(__name__)
+
+ACTIVATION_FEE = 300
+ACTIVATION_PREFIX = 'ACTIVATE-'
+OPEN_STATUSES = ('processing', 'sent')
+# Recorded when reconciliation gives up on a push Daraja never settled
+EXPIRED_RESULT_CODE = -1
+
+
+def payment_data(payment_request):
+    return PaymentRequestSerializer(payment_request).data
+
+
+def _set_status(payment_request, status, **fields):
+    fields['status'] = status
+    for name, value in fields.items():
+        setattr(payment_request, name, value)
+    payment_request.save(update_fields=[*fields, 'updated_at'])
+    publish(payment_request.user_id, 'payment', payment_data(payment_request))
+
+
+def enqueue_stk_push(user, phone_number, amount, account_reference, description):
+    """Queue an STK push; raises ledger.InvalidAmount unless ``amount`` is whole shillings."""
+    return PaymentRequest.objects.create(
+        user=user,
+        phone_number=phone_number,
+        amount=ledger.to_whole_amount(amount),
+        account_reference=account_reference,
+        description=description,
+    )
+
+
+def claim_batch(limit):
+    """
+    Move up to ``limit`` queued requests to 'processing' and return them.
+
+    Each row is claimed with a conditional UPDATE, so concurrent workers
+    never send the same push twice.
+    """
+    candidates = PaymentRequest.objects.filter(status='queued').order_by('created_at')
+    claimed = []
+    for pk in candidates.values_list('pk', flat=True)[:limit]:
+        if PaymentRequest.objects.filter(pk=pk, status='queued').update(
+            status='processing', updated_at=timezone.now()
+        ):
+            claimed.append(pk)
+    return list(PaymentRequest.objects.filter(pk__in=claimed).order_by('created_at'))
+
+
+def fail_stale(after_seconds):
+    """
+    Fail requests a crashed worker left in 'processing'.
+
+    The push may or may not have reached Daraja, so they are not retried
+    automatically; the user can simply start a new payment.
+    """
+    cutoff = timezone.now() - timedelta(seconds=after_seconds)
+    stale = PaymentRequest.objects.filter(status='processing', updated_at__lt=cutoff)
+    for payment_request in stale:
+        _set_status(payment_request, 'failed', result_desc='Interrupted before Daraja confirmed the request.')
+
+
+def send(payment_request, client=None):
+    client = client or get_client()
+    try:
+        response = client.stk_push(
+            phone_number=payment_request.phone_number,
+            amount=payment_request.amount,
+            account_reference=payment_request.account_reference,
+            transaction_desc=payment_request.description,
+        )
+    except DarajaError as e:
+        logger.warning('STK push for payment request %s failed: %s', payment_request.pk, e)
+        _set_status(payment_request, 'failed', result_desc=str(e)[:255])
+        return payment_request
+
+    if str(response.get('ResponseCode')) == '0' and response.get('CheckoutRequestID'):
+        _set_status(
+            payment_request, 'sent',
+            checkout_request_id=response['CheckoutRequestID'],
+            merchant_request_id=response.get('MerchantRequestID', ''),
+            result_desc=response.get('CustomerMessage', '')[:255],
+        )
+    else:
+        _set_status(
+            payment_request, 'failed',
+            result_desc=(response.get('errorMessage') or response.get('ResponseDescription') or '')[:255],
+        )
+    return payment_request
+
+
+def _send_in_thread(payment_request):
+    try:
+        return send(payment_request)
+    finally:
+        close_old_connections()
+
+
+def process_batch(limit, concurrency):
+    """Claim and send one batch; returns the number of requests handled."""
+    batch = claim_batch(limit)
+    if batch:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(_send_in_thread, batch))
+    return len(batch)
+
+
+def apply_results(results):
+    """
+    Settle sent pushes from Daraja results in bulk.
+
+    ``results`` maps CheckoutRequestID to ``(result_code, result_desc)``.
+    Requests that are no longer open (e.g. a replayed callback) are skipped.
+    Statuses, account activations and wallet credits are each written with a
+    constant number of queries. Returns the settled PaymentRequests.
+    """
+    if not results:
+        return []
+    with transaction.atomic():
+        open_requests = list(
+            PaymentRequest.objects.select_for_update()
+            .filter(checkout_request_id__in=results, status__in=OPEN_STATUSES)
+        )
+        now = timezone.now()
+        for payment_request in open_requests:
+            result_code, result_desc = results[payment_request.checkout_request_id]
+            payment_request.status = 'succeeded' if result_code == 0 else 'failed'
+            payment_request.result_code = result_code
+            payment_request.result_desc = (result_desc or '')[:255]
+            payment_request.updated_at = now
+        PaymentRequest.objects.bulk_update(
+            open_requests, ['status', 'result_code', 'result_desc', 'updated_at'], batch_size=500
+        )
+
+        succeeded = [p for p in open_requests if p.status == 'succeeded']
+        activated = {p.user_id for p in succeeded if p.account_reference.startswith(ACTIVATION_PREFIX)}
+        if activated:
+            User.objects.filter(pk__in=activated).update(is_activated=True)
+            for user_id in activated:
+                # queryset.update() skips the post_save that clears cached credentials
+                transaction.on_commit(functools.partial(invalidate_user, user_id))
+        ledger.credit_many([
+            (p.user_id, p.amount, 'M-Pesa deposit')
+            for p in succeeded if not p.account_reference.startswith(ACTIVATION_PREFIX)
+        ])
+
+        for payment_request in open_requests:
+            publish(payment_request.user_id, 'payment', payment_data(payment_request))
+    return open_requests
+
+
+def record_callback(payload):
+    """Store an STK callback for the worker; cheap enough to run in the request."""
+    try:
+        result = payload['Body']['stkCallback']
+        checkout_id = result['CheckoutRequestID']
+    except (KeyError, TypeError):
+        return None
+    if not checkout_id:
+        return None
+    return MpesaCallback.objects.create(
+        checkout_request_id=checkout_id,
+        result_code=result.get('ResultCode'),
+        result_desc=str(result.get('ResultDesc', ''))[:255],
+        payload=payload,
+    )
+
+
+def process_callbacks(limit, concurrency=8, client=None):
+    """
+    Apply up to ``limit`` stored callbacks; returns how many were handled.
+
+    The callback URL is public, so a callback is only trusted to report a
+    failure. A reported success is confirmed with an STK query first and
+    Daraja's answer is applied instead; a push Daraja has not settled yet
+    stays open for ``reconcile``.
+    """
+    callbacks = list(
+        MpesaCallback.objects.filter(processed_at__isnull=True).order_by('id')[:limit]
+    )
+    if not callbacks:
+        return 0
+    results = {}
+    for callback in callbacks:
+        # Later callbacks for the same checkout win; apply_results ignores replays
+        results[callback.checkout_request_id] = (callback.result_code, callback.result_desc)
+
+    to_confirm = list(
+        PaymentRequest.objects.filter(
+            checkout_request_id__in=[checkout_id for checkout_id, (code, _) in results.items() if code == 0],
+            status__in=OPEN_STATUSES,
+        ).values_list('checkout_request_id', flat=True)
+    )
+    if to_confirm:
+        client = client or get_client()
+        limiter = RateLimiter(0)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            answers = dict(pool.map(functools.partial(_query_status, client, limiter), to_confirm))
+    else:
+        answers = {}
+    for checkout_id, (code, _) in list(results.items()):
+        if code == 0:
+            if answers.get(checkout_id) is None:
+                del results[checkout_id]
+            else:
+                results[checkout_id] = answers[checkout_id]
+
+    with transaction.atomic():
+        settled = apply_results(results)
+        MpesaCallback.objects.filter(pk__in=[c.pk for c in callbacks]).update(processed_at=timezone.now())
+    unsettled = len(callbacks) - len(settled)
+    if unsettled:
+        logger.info('%s M-Pesa callbacks were replays, unconfirmed or matched no open payment request',
+                    unsettled)
+    return len(callbacks)
+
+
+def _query_status(client, limiter, checkout_id):
+    limiter.acquire()
+    try:
+        response = client.stk_query(checkout_id)
+    except DarajaError as e:
+        if (e.payload or {}).get('errorCode') != PENDING_ERROR_CODE:
+            logger.warning('STK query for %s failed: %s', checkout_id, e)
+        return checkout_id, None
+    try:
+        return checkout_id, (int(response['ResultCode']), response.get('ResultDesc', ''))
+    except (KeyError, TypeError, ValueError):
+        return checkout_id, None
+
+
+def reconcile(limit, concurrency, rate, min_age, recheck_after, expire_after, client=None):
+    """
+    Settle sent pushes whose callback never arrived by asking Daraja.
+
+    Pushes older than ``min_age`` seconds that were not checked in the last
+    ``recheck_after`` seconds are queried (at most ``concurrency`` in flight
+    and ``rate`` per second), and every definitive answer is applied in bulk
+    through apply_results. Pushes still unanswered after ``expire_after``
+    seconds are failed. Returns ``(checked, settled)``.
+    """
+    client = client or get_client()
+    now = timezone.now()
+    due = (
+        PaymentRequest.objects
+        .filter(status='sent', updated_at__lt=now - timedelta(seconds=min_age))
+        .filter(Q(last_checked_at__isnull=True) | Q(last_checked_at__lt=now - timedelta(seconds=recheck_after)))
+        .order_by(F('last_checked_at').asc(nulls_first=True), 'created_at')
+        .values_list('pk', 'checkout_request_id', 'created_at')[:limit]
+    )
+    due = list(due)
+    if not due:
+        return 0, 0
+
+    limiter = RateLimiter(rate, burst=concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        answers = dict(pool.map(
+            functools.partial(_query_status, client, limiter),
+            [checkout_id for _, checkout_id, _ in due]
+        ))
+
+    results = {checkout_id: answer for checkout_id, answer in answers.items() if answer is not None}
+    expire_before = now - timedelta(seconds=expire_after)
+    for _, checkout_id, created_at in due:
+        if checkout_id not in results and created_at < expire_before:
+            results[checkout_id] = (EXPIRED_RESULT_CODE, 'No result from M-Pesa before the request expired.')
+
+    PaymentRequest.objects.filter(pk__in=[pk for pk, _, _ in due]).update(last_checked_at=timezone.now())
+    settled = apply_results(results)
+    return len(due), len(settled)
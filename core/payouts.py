@@ -0,0 +1,181 @@
+"""
+Withdrawals paid out through M-Pesa B2C.
+
+A withdrawal places a ledger hold and queues a Payout. The
+``process_payouts`` worker claims queued payouts in batches and sends them
+to Daraja concurrently under a shared rate limit. Daraja reports the outcome
+to the B2C result URL: a success captures the hold as the withdrawal debit,
+a failure releases it back to the balance, each in one transaction with the
+payout's status change.
+
+Payouts left in 'processing' by a crashed worker, an unanswered request or
+a 5xx from Daraja may or may not have reached Daraja and are deliberately
+not retried or released automatically.
+"""
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import ledger
+from .models import Payout
+from .mpesa import DarajaError, get_client
+from .realtime import publish
+
+logger = logging.getLogger(__name__)
+
+PAYOUT_DESCRIPTION = 'Withdrawal to M-Pesa'
+
+
+def payout_data(payout):
+    return {
+        'id': payout.id,
+        'status': payout.status,
+        'amount': str(payout.amount),
+        'phone_number': payout.phone_number,
+        'result_desc': payout.result_desc,
+    }
+
+
+def payout_phone(user):
+    """The M-Pesa number to pay ``user``, as 2547XXXXXXXX, or None."""
+    number = user.payment_identifier if user.payment_method == 'mpesa' else user.phone_number
+    number = (number or '').strip().replace(' ', '').lstrip('+')
+    if number.startswith('0') and len(number) == 10:
+        number = '254' + number[1:]
+    if number.startswith('254') and len(number) == 12 and number.isdigit():
+        return number
+    return None
+
+
+def request_payout(wallet, amount, phone_number):
+    """Hold ``amount`` and queue its payout; raises ledger errors like ledger.hold."""
+    # The held amount is exactly what Daraja is asked to pay
+    amount = ledger.to_whole_amount(amount)
+    with transaction.atomic():
+        wallet_hold = ledger.hold(wallet, amount, 'Withdrawal request')
+        return Payout.objects.create(
+            user_id=wallet.user_id, hold=wallet_hold, phone_number=phone_number, amount=wallet_hold.amount
+        )
+
+
+# ------------------ DISPATCH ------------------
+def claim_batch(limit):
+    candidates = Payout.objects.filter(status='queued').order_by('created_at')
+    claimed = [
+        pk for pk in candidates.values_list('pk', flat=True)[:limit]
+        if Payout.objects.filter(pk=pk, status='queued').update(status='processing', updated_at=timezone.now())
+    ]
+    return list(Payout.objects.filter(pk__in=claimed).order_by('created_at'))
+
+
+def _dispatch(client, limiter, payout):
+    try:
+        limiter.acquire()
+        try:
+            response = client.b2c_payment(
+                payout.originator_conversation_id, payout.phone_number, payout.amount,
+                remarks=PAYOUT_DESCRIPTION,
+            )
+        except DarajaError as e:
+            if e.status_code is None or e.status_code >= 500:
+                # No answer or a server error: Daraja may still have taken the
+                # request, so the hold stays until someone checks the payout by hand
+                logger.error('B2C payout %s has an unknown outcome: %s', payout.pk, e)
+                return False
+            logger.warning('B2C payout %s was rejected: %s', payout.pk, e)
+            settle(payout.originator_conversation_id, None, str(e), from_statuses=('processing',))
+            return False
+        if str(response.get('ResponseCode')) != '0':
+            settle(payout.originator_conversation_id, None,
+                   response.get('ResponseDescription', 'Rejected by M-Pesa'), from_statuses=('processing',))
+            return False
+        Payout.objects.filter(pk=payout.pk, status='processing').update(
+            status='sent', conversation_id=response.get('ConversationID', ''), updated_at=timezone.now()
+        )
+        return True
+    finally:
+        close_old_connections()
+
+
+def process_batch(limit, concurrency, limiter, client=None):
+    """Claim and dispatch one batch; returns ``(claimed, accepted)``."""
+    batch = claim_batch(limit)
+    if not batch:
+        return 0, 0
+    client = client or get_client()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        accepted = sum(pool.map(functools.partial(_dispatch, client, limiter), batch))
+    return len(batch), accepted
+
+
+class Throughput:
+    """Running payout dispatch rate for the worker's log lines."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.dispatched = 0
+        self.accepted = 0
+
+    def add(self, dispatched, accepted):
+        self.dispatched += dispatched
+        self.accepted += accepted
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (f'{self.dispatched} payouts dispatched, {self.accepted} accepted, '
+                f'{self.dispatched / elapsed:.1f}/s')
+
+
+# ------------------ RESULTS ------------------
+def settle(originator_conversation_id, result_code, result_desc, transaction_id='',
+           from_statuses=('processing', 'sent')):
+    """
+    Apply a payout outcome: result_code 0 captures the hold, anything else
+    (including None for a request Daraja never accepted) releases it.
+    Returns False if the payout was unknown or already settled.
+    """
+    succeeded = result_code == 0
+    with transaction.atomic():
+        payout = (
+            Payout.objects.select_for_update().select_related('hold')
+            .filter(originator_conversation_id=originator_conversation_id, status__in=from_statuses)
+            .first()
+        )
+        if payout is None:
+            return False
+        payout.status = 'succeeded' if succeeded else 'failed'
+        payout.result_code = result_code
+        payout.result_desc = (result_desc or '')[:255]
+        payout.transaction_id = transaction_id or ''
+        payout.save(update_fields=['status', 'result_code', 'result_desc', 'transaction_id', 'updated_at'])
+        if succeeded:
+            ledger.capture(payout.hold, PAYOUT_DESCRIPTION)
+        else:
+            ledger.release(payout.hold)
+        publish(payout.user_id, 'payout', payout_data(payout))
+    return True
+
+
+def handle_result(payload):
+    """Apply a B2C result callback body; returns False if it was not usable."""
+    try:
+        result = payload['Result']
+        originator_id = result['OriginatorConversationID']
+        result_code = int(result['ResultCode'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return settle(originator_id, result_code, result.get('ResultDesc', ''), result.get('TransactionID', ''))
+
+
+def handle_timeout(payload):
+    """Daraja dropped the request from its queue; the money never moved."""
+    try:
+        result = payload['Result']
+        originator_id = result['OriginatorConversationID']
+    except (KeyError, TypeError):
+        return False
+    return settle(originator_id, None, result.get('ResultDesc') or 'Timed out in the M-Pesa queue')
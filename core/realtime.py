@@ -0,0 +1,269 @@
+"""
+Real-time push of new messages and notifications.
+
+Rows are published to a per-user channel after their transaction commits and
+streamed to connected clients as Server-Sent Events from the ASGI app. The
+default broker only reaches clients connected to the same process; set
+REALTIME_BROKER_URL to a redis:// URL to fan out across workers. The same
+broker wakes long-polling requests on the incremental sync endpoints.
+"""
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+
+from .models import Message, Notification
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+LONG_POLL_MAX_SECONDS = 25
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """Async iterator over the events published to one user."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Called from any thread; hand the event to the subscriber's loop.
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning('Dropping realtime event for slow subscriber %s', self.user_id)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        self.deliver_local(user_id, event)
+
+    def deliver_local(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes through Redis pub/sub so every worker sees every event.
+
+    Each process runs one listener thread that fans events out to its local
+    subscribers, so the number of Redis connections does not grow with clients.
+    """
+    channel_prefix = 'freelancer:realtime:'
+
+    def __init__(self, url):
+        import redis
+
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, user_id):
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, event):
+        self._redis.publish(f'{self.channel_prefix}{user_id}', json.dumps(event))
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f'{self.channel_prefix}*')
+        for item in pubsub.listen():
+            try:
+                channel = item['channel'].decode()
+                user_id = int(channel[len(self.channel_prefix):])
+                self.deliver_local(user_id, json.loads(item['data']))
+            except (KeyError, ValueError):
+                logger.exception('Ignoring malformed realtime event')
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            url = getattr(settings, 'REALTIME_BROKER_URL', None)
+            _broker = RedisBroker(url) if url else InProcessBroker()
+        return _broker
+
+
+def publish(user_id, event_type, data):
+    event = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(user_id, event))
+
+
+@receiver(post_save, sender=Message)
+def push_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        from .serializers import MessageSerializer
+        data = MessageSerializer(instance).data
+        publish(instance.receiver_id, 'message', data)
+        if instance.sender_id != instance.receiver_id:
+            publish(instance.sender_id, 'message', data)
+
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        from .serializers import NotificationSerializer
+        publish(instance.user_id, 'notification', NotificationSerializer(instance).data)
+
+
+# ------------------ SSE ENDPOINT ------------------
+@sync_to_async
+def _user_for_token(key):
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def _request_token(request):
+    # EventSource cannot send headers, so the token may also come as ?token=
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Token '):
+        return header[len('Token '):].strip()
+    return request.GET.get('token')
+
+
+def _format_event(event):
+    data = json.dumps(event['data'], default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def events_view(request):
+    """Stream the user's new messages and notifications as Server-Sent Events."""
+    if request.method != 'GET':
+        return HttpResponse(status=405)
+    key = _request_token(request)
+    user = await _user_for_token(key) if key else None
+    if user is None:
+        return HttpResponse('Authentication credentials were not provided.', status=401)
+
+    async def stream():
+        subscription = get_broker().subscribe(user.pk)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _format_event(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ------------------ LONG POLLING ------------------
+def _wait_seconds(request):
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return 0
+    return max(0.0, min(wait, LONG_POLL_MAX_SECONDS))
+
+
+def long_poll(event_type):
+    """
+    Let a ``?since=`` GET hold for up to ``?wait=`` seconds until new rows exist.
+
+    The wrapped (sync) view runs once; if its page is empty the request parks
+    on the realtime broker, without holding a worker thread, until an
+    ``event_type`` event arrives for the user or the wait runs out, then runs
+    the view again. Every other request goes straight to the view.
+    """
+    def decorator(view):
+        sync_view = sync_to_async(view)
+
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            wait = _wait_seconds(request)
+            if request.method != 'GET' or not wait or 'since' not in request.GET:
+                return await sync_view(request, *args, **kwargs)
+
+            key = _request_token(request)
+            user = await _user_for_token(key) if key else None
+            if user is None:
+                return await sync_view(request, *args, **kwargs)
+
+            # Subscribe before the first query so nothing committed in between is missed
+            subscription = get_broker().subscribe(user.pk)
+            try:
+                response = await sync_view(request, *args, **kwargs)
+                if response.status_code != 200 or response.data.get('results'):
+                    return response
+                deadline = time.monotonic() + wait
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        event = await subscription.get(timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if event['type'] == event_type:
+                        return await sync_view(request, *args, **kwargs)
+                return response
+            finally:
+                subscription.close()
+        return wrapper
+    return decorator
@@ -0,0 +1,71 @@
+"""
+Skill-matched task recommendations.
+
+Task skills are mirrored into the TaskSkill inverted index so matching a user
+is one grouped index scan over the skills they have, instead of decoding the
+skills_required JSON of every task.
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Task, TaskSkill, normalize_skills
+from .search import rows_in_order
+
+
+def index_task_skills(task):
+    skills = set(normalize_skills(task.skills_required))
+    existing = set(TaskSkill.objects.filter(task=task).values_list('skill', flat=True))
+    with transaction.atomic():
+        stale = existing - skills
+        if stale:
+            TaskSkill.objects.filter(task=task, skill__in=stale).delete()
+        TaskSkill.objects.bulk_create(
+            [TaskSkill(task=task, skill=skill) for skill in skills - existing],
+            ignore_conflicts=True
+        )
+
+
+def recommended_task_scores(skills, limit, offset=0):
+    """
+    Return ``[(task_id, score), ...]`` best match first.
+
+    The score is the number of the user's skills a task asks for; ties go to
+    the newest task.
+    """
+    skills = normalize_skills(skills)
+    if not skills:
+        return []
+    rows = (
+        TaskSkill.objects.filter(skill__in=skills)
+        .values('task_id')
+        .annotate(score=Count('id'))
+        .order_by('-score', '-task_id')
+        .values_list('task_id', 'score')
+    )
+    return list(rows[offset:offset + limit])
+
+
+def recommended_tasks(user, limit, offset=0, queryset=None):
+    """
+    Return tasks matching ``user.skills``, best first, with ``match_score`` set
+    (as an attribute on models, as a key on ``.values()`` rows).
+    """
+    scores = dict(recommended_task_scores(user.skills, limit, offset))
+    if queryset is None:
+        queryset = Task.objects.all()
+    tasks = rows_in_order(queryset, list(scores))
+    for task in tasks:
+        if isinstance(task, dict):
+            task['match_score'] = scores[task['id']]
+        else:
+            task.match_score = scores[task.pk]
+    return tasks
+
+
+@receiver(post_save, sender=Task)
+def update_task_skill_index(sender, instance, raw=False, **kwargs):
+    # Deletes are handled by the TaskSkill foreign key cascade.
+    if not raw:
+        index_task_skills(instance)
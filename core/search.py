@@ -0,0 +1,187 @@
+"""
+Full-text search over tasks.
+
+SQLite keeps an FTS5 table keyed by task id, Postgres keeps a weighted tsvector
+side table with a GIN index. Both are kept up to date from Task signals and are
+queried for task ids in relevance order.
+"""
+import re
+
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Task
+
+FTS_TABLE = 'core_task_fts'
+PG_TABLE = 'core_task_search'
+
+# Column weights: title, description, category, skills
+SQLITE_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def create_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, description, category, skills, tokenize='porter unicode61')"
+            )
+        elif conn.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+                "task_id bigint PRIMARY KEY REFERENCES core_task(id) ON DELETE CASCADE, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_gin ON {PG_TABLE} USING GIN (document)"
+            )
+
+
+def drop_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif conn.vendor == 'postgresql':
+            cursor.execute(f"DROP TABLE IF EXISTS {PG_TABLE}")
+
+
+def _document(task):
+    skills = task.skills_required or []
+    if not isinstance(skills, list):
+        skills = [skills]
+    return (task.title, task.description, task.category, ' '.join(str(s) for s in skills))
+
+
+def index_task(task, conn=connection):
+    title, description, category, skills = _document(task)
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [task.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, category, skills) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [task.pk, title, description, category, skills]
+            )
+        elif conn.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {PG_TABLE} (task_id, document) VALUES (%s, "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'D')) "
+                "ON CONFLICT (task_id) DO UPDATE SET document = EXCLUDED.document",
+                [task.pk, title, category, skills, description]
+            )
+
+
+def remove_task(task_id, conn=connection):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [task_id])
+        elif conn.vendor == 'postgresql':
+            cursor.execute(f"DELETE FROM {PG_TABLE} WHERE task_id = %s", [task_id])
+
+
+def rebuild_index(conn=connection):
+    """Re-index every task, e.g. after a bulk import that bypassed signals."""
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        elif conn.vendor == 'postgresql':
+            cursor.execute(f"DELETE FROM {PG_TABLE}")
+    count = 0
+    for task in Task.objects.all().iterator(chunk_size=500):
+        index_task(task, conn)
+        count += 1
+    return count
+
+
+def _fts5_query(query):
+    # Quote every token so user input can never be parsed as FTS5 syntax,
+    # and allow prefix matches so "pyth" finds "python".
+    tokens = TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _restrict(within):
+    """SQL fragment and params limiting a ranked query to the ids in ``within``."""
+    if within is None:
+        return '', []
+    sql, params = within.order_by().values('pk').query.sql_with_params()
+    return f'IN ({sql})', list(params)
+
+
+def search_task_ids(query, limit, offset=0, within=None):
+    """
+    Return ids of tasks matching ``query``, best match first.
+
+    ``within`` is an optional Task queryset (e.g. the listing filters); it is
+    applied inside the ranked query so LIMIT/OFFSET count only matching tasks.
+    """
+    restrict, restrict_params = _restrict(within)
+    if connection.vendor == 'sqlite':
+        match = _fts5_query(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in SQLITE_WEIGHTS)
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            + (f"AND rowid {restrict} " if restrict else '')
+            + f"ORDER BY bm25({FTS_TABLE}, {weights}), rowid DESC LIMIT %s OFFSET %s"
+        )
+        params = [match, *restrict_params, limit, offset]
+    elif connection.vendor == 'postgresql':
+        if not query.strip():
+            return []
+        sql = (
+            f"SELECT task_id FROM {PG_TABLE}, websearch_to_tsquery('english', %s) query "
+            "WHERE document @@ query "
+            + (f"AND task_id {restrict} " if restrict else '')
+            + "ORDER BY ts_rank_cd(document, query) DESC, task_id DESC LIMIT %s OFFSET %s"
+        )
+        params = [query, *restrict_params, limit, offset]
+    else:
+        # No full-text index on this backend: fall back to a plain scan.
+        from django.db.models import Q
+        filters = Q()
+        for token in TOKEN_RE.findall(query):
+            filters &= Q(title__icontains=token) | Q(description__icontains=token)
+        tasks = Task.objects.all() if within is None else Task.objects.filter(pk__in=within.values('pk'))
+        return list(
+            tasks.filter(filters).order_by('-created_at', '-id')
+            .values_list('id', flat=True)[offset:offset + limit]
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def rows_in_order(queryset, ids):
+    """Fetch ``ids`` from ``queryset`` (models or .values() dicts) in the given order."""
+    by_id = {}
+    for row in queryset.filter(pk__in=ids):
+        by_id[row['id'] if isinstance(row, dict) else row.pk] = row
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+def search_tasks(query, limit, offset=0, queryset=None):
+    """Return matching tasks from ``queryset`` as a list in relevance order."""
+    ids = search_task_ids(query, limit, offset, within=queryset)
+    if queryset is None:
+        queryset = Task.objects.all()
+    return rows_in_order(queryset, ids)
+
+
+@receiver(post_save, sender=Task)
+def update_task_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_task(instance)
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_search_index(sender, instance, **kwargs):
+    remove_task(instance.pk)
@@ -1,6 +1,10 @@
+from datetime import datetime
+from decimal import Decimal
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth import get_user_model
-from .models import Task, Application, Bookmark, Message, Notification
+from .models import Task, Application, Bookmark, Message, Notification, Conversation, PaymentRequest, Transaction
 
 User = get_user_model()
 
@@ -41,6 +45,11 @@ class PaymentDetailsSerializer(serializers.ModelSerializer):
         fields = ['payment_method', 'payment_identifier']
 
 class TaskSerializer(serializers.ModelSerializer):
+    # Filled from TaskQuerySet.with_user_state(); omitted when not annotated
+    is_bookmarked = serializers.BooleanField(read_only=True)
+    has_applied = serializers.BooleanField(read_only=True)
+    applications_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Task
         fields = '__all__'
@@ -62,7 +71,205 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'sender', 'receiver', 'content', 'timestamp', 'read']
         read_only_fields = ['sender', 'timestamp']
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture']
+
+class ConversationSerializer(serializers.ModelSerializer):
+    partner = serializers.SerializerMethodField()
+    last_message = MessageSerializer(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'partner', 'last_message', 'unread_count', 'updated_at']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?fields= support; the view also skips the joins for dropped fields
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_partner(self, conversation):
+        user = self.context['request'].user
+        partner = conversation.user_high if conversation.user_low_id == user.pk else conversation.user_low
+        return UserSummarySerializer(partner).data
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'message', 'is_read', 'created_at']
\ No newline at end of file
+        fields = ['id', 'message', 'is_read', 'created_at']
+
+class DateOnlyField(serializers.DateField):
+    """Renders a datetime column as its date."""
+
+    def to_representation(self, value):
+        if isinstance(value, datetime):
+            value = value.date()
+        return super().to_representation(value)
+
+class TransactionSerializer(serializers.ModelSerializer):
+    type = serializers.CharField(source='transaction_type')
+    date = DateOnlyField(source='created_at')
+
+    class Meta:
+        model = Transaction
+        fields = ['id', 'type', 'description', 'amount', 'date']
+
+class PaymentRequestSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentRequest
+        # checkout_request_id stays server-side: it is all a forged callback would need
+        fields = ['id', 'status', 'amount', 'result_desc', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+# ------------------ READ-OPTIMIZED LIST SERIALIZATION ------------------
+def _datetime_to_representation(field):
+    timezone_ = getattr(field, 'timezone', None) or field.default_timezone()
+
+    def convert(value):
+        # Same output as DRF's DateTimeField with the default ISO-8601 format
+        value = value.astimezone(timezone_).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _decimal_to_representation(field):
+    quantum = Decimal(1).scaleb(-field.decimal_places)
+
+    def convert(value):
+        return '{:f}'.format(value.quantize(quantum))
+    return convert
+
+
+class ValuesSerializer:
+    """
+    Builds list output straight from ``.values()`` rows.
+
+    The column list and per-column converters are derived once from a DRF
+    serializer class, so the output matches it while skipping model
+    instantiation and the per-row field machinery.
+
+    ``?fields=`` narrows the SELECT to the requested columns and
+    ``?expand=`` replaces a related id with a user summary fetched through a
+    JOIN in the same query (see ``for_request``).
+    """
+    IDENTITY_FIELDS = (
+        serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+        serializers.JSONField, serializers.PrimaryKeyRelatedField, serializers.ChoiceField,
+    )
+
+    def __init__(self, serializer_class, required=('id',), expandable=()):
+        self.name = serializer_class.__name__
+        self.fields = {}
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.DateTimeField):
+                converter = _datetime_to_representation(field)
+            elif isinstance(field, serializers.DecimalField) and getattr(
+                    field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+                converter = _decimal_to_representation(field)
+            elif isinstance(field, serializers.DateField):
+                converter = field.to_representation
+            elif isinstance(field, self.IDENTITY_FIELDS):
+                converter = None
+            else:
+                raise TypeError(f'{self.name}.{name} has no values() fast path')
+            self.fields[name] = (field.source, converter)
+        # Columns the pagination cursor needs even when ?fields= leaves them out
+        self.required = required
+        self.expandable = {name: ValuesSerializer(UserSummarySerializer) for name in expandable}
+        self.default = self.select()
+
+    def select(self, fields=None, expand=()):
+        names = list(self.fields) if fields is None else [n for n in self.fields if n in fields]
+        names.extend(n for n in expand if n not in names)
+        columns, converters, expansions = [], [], []
+        for name in names:
+            source, converter = self.fields[name]
+            if name in expand:
+                nested = self.expandable[name]
+                expansions.append((name, [
+                    (f'{source}__{nested_source}', nested_name, nested_converter)
+                    for nested_name, (nested_source, nested_converter) in nested.fields.items()
+                ]))
+                columns.extend(column for column, _, _ in expansions[-1][1])
+                continue
+            columns.append(source)
+            if converter is not None or source != name:
+                converters.append((source, name, converter))
+        drop = [column for column in self.required if column not in columns]
+        return ValuesSelection(columns + drop, converters, expansions, drop)
+
+    def for_request(self, request):
+        """Return the selection asked for by ``?fields=`` and ``?expand=``."""
+        fields = requested_fields(request, self.fields)
+        expand = _csv_param(request, 'expand') or []
+        unknown = set(expand) - set(self.expandable)
+        if unknown:
+            raise serializers.ValidationError({'expand': f"Cannot expand: {', '.join(sorted(unknown))}"})
+        if fields is None and not expand:
+            return self.default
+        return self.select(fields, expand)
+
+    def values(self, queryset):
+        return self.default.values(queryset)
+
+    def __call__(self, rows):
+        return self.default(rows)
+
+
+class ValuesSelection:
+    def __init__(self, columns, converters, expansions, drop):
+        self.columns = columns
+        self.converters = converters
+        self.expansions = expansions
+        self.drop = drop
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def __call__(self, rows):
+        """Convert a page of ``.values()`` dicts in place and return it."""
+        for row in rows:
+            for source, name, convert in self.converters:
+                value = row.pop(source) if source != name else row[source]
+                row[name] = value if value is None or convert is None else convert(value)
+            for name, nested_columns in self.expansions:
+                nested = {}
+                for column, nested_name, convert in nested_columns:
+                    value = row.pop(column)
+                    nested[nested_name] = value if value is None or convert is None else convert(value)
+                row[name] = nested if nested.get('id') is not None else None
+            for column in self.drop:
+                row.pop(column, None)
+        return rows
+
+
+def _csv_param(request, name):
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return [part.strip() for part in raw.split(',') if part.strip()]
+
+
+def requested_fields(request, allowed):
+    """The ``?fields=`` list checked against ``allowed``, or None when absent."""
+    fields = _csv_param(request, 'fields')
+    if fields is not None:
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"})
+    return fields
+
+
+TASK_VALUES = ValuesSerializer(TaskSerializer, required=('id', 'created_at'), expandable=('posted_by',))
+MESSAGE_VALUES = ValuesSerializer(MessageSerializer, required=('id', 'timestamp'), expandable=('sender', 'receiver'))
+NOTIFICATION_VALUES = ValuesSerializer(NotificationSerializer, required=('id', 'created_at'))
+TRANSACTION_VALUES = ValuesSerializer(TransactionSerializer, required=('id', 'created_at'))
+USER_VALUES = ValuesSerializer(UserSerializer)
@@ -0,0 +1,255 @@
+"""
+A local stand-in for Safaricom's Daraja API, for load tests without a network.
+
+It implements the OAuth, STK push, STK query and B2C payment endpoints and
+delivers STK callbacks and B2C results asynchronously to the URLs given in
+each request (or fixed URLs), with configurable response latency, API error
+rate, payment failure rate and callback replays. Point MPESA_BASE_URL at it;
+``python manage.py daraja_simulator`` runs it.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from .mpesa import CallMetrics
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TTL = 3599
+# Result codes Daraja sends for a failed STK push
+FAILURE_RESULTS = [
+    (1032, 'Request cancelled by user'),
+    (1037, 'DS timeout user cannot be reached'),
+    (2001, 'The initiator information is invalid.'),
+]
+
+
+class SimulatorConfig:
+    def __init__(self, latency=0.0, error_rate=0.0, failure_rate=0.0, callback_delay=1.0,
+                 callback_burst=1, callback_url=None, b2c_result_url=None, callback_workers=16):
+        self.latency = latency                # seconds added to every API response
+        self.error_rate = error_rate          # fraction of API calls answered with 503
+        self.failure_rate = failure_rate      # fraction of STK pushes whose callback reports failure
+        self.callback_delay = callback_delay  # seconds between the push and its callback
+        self.callback_burst = callback_burst  # times each callback is delivered
+        self.callback_url = callback_url      # overrides the CallBackURL sent with each push
+        self.b2c_result_url = b2c_result_url  # overrides the ResultURL sent with each B2C payment
+        self.callback_workers = callback_workers
+
+
+class DarajaSimulator:
+    def __init__(self, config):
+        self.config = config
+        self.metrics = CallMetrics(samples=5000)
+        self.tokens = set()
+        self.checkouts = {}  # CheckoutRequestID -> (result_code, result_desc) once decided
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.callbacks = ThreadPoolExecutor(max_workers=config.callback_workers)
+        self.started_at = time.monotonic()
+
+    # ------------------ API ------------------
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens.add(token)
+        return {'access_token': token, 'expires_in': str(TOKEN_TTL)}
+
+    def authorized(self, header):
+        token = header[len('Bearer '):] if header and header.startswith('Bearer ') else None
+        with self.lock:
+            return token in self.tokens
+
+    def stk_push(self, payload):
+        checkout_id = f'ws_CO_{uuid.uuid4().hex[:20]}'
+        merchant_id = f'{random.randint(10000, 99999)}-{random.randint(10 ** 7, 10 ** 8 - 1)}-1'
+        with self.lock:
+            self.checkouts[checkout_id] = None
+        callback_url = self.config.callback_url or payload.get('CallBackURL')
+        timer = threading.Timer(
+            self.config.callback_delay, self.callbacks.submit,
+            args=(self.send_callback, callback_url, checkout_id, merchant_id, payload)
+        )
+        timer.daemon = True
+        timer.start()
+        return {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+
+    def stk_query(self, payload):
+        checkout_id = payload.get('CheckoutRequestID')
+        with self.lock:
+            known = checkout_id in self.checkouts
+            result = self.checkouts.get(checkout_id)
+        if not known:
+            return 400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'}
+        if result is None:
+            return 500, {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+        result_code, result_desc = result
+        return 200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'CheckoutRequestID': checkout_id,
+            'ResultCode': str(result_code),
+            'ResultDesc': result_desc,
+        }
+
+    def b2c_payment(self, payload):
+        originator_id = payload.get('OriginatorConversationID') or uuid.uuid4().hex
+        conversation_id = f'AG_{time.strftime("%Y%m%d")}_{uuid.uuid4().hex[:20]}'
+        timer = threading.Timer(
+            self.config.callback_delay, self.callbacks.submit,
+            args=(self.send_b2c_result, payload, originator_id, conversation_id)
+        )
+        timer.daemon = True
+        timer.start()
+        return {
+            'ConversationID': conversation_id,
+            'OriginatorConversationID': originator_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Accept the service request successfully.',
+        }
+
+    # ------------------ CALLBACKS ------------------
+    def decide(self):
+        if random.random() < self.config.failure_rate:
+            return random.choice(FAILURE_RESULTS)
+        return 0, 'The service request is processed successfully.'
+
+    def send_callback(self, url, checkout_id, merchant_id, push):
+        result_code, result_desc = self.decide()
+        with self.lock:
+            self.checkouts[checkout_id] = (result_code, result_desc)
+        callback = {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResultCode': result_code,
+            'ResultDesc': result_desc,
+        }
+        if result_code == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': push.get('Amount')},
+                {'Name': 'MpesaReceiptNumber', 'Value': uuid.uuid4().hex[:10].upper()},
+                {'Name': 'TransactionDate', 'Value': int(time.strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': push.get('PhoneNumber')},
+            ]}
+        body = {'Body': {'stkCallback': callback}}
+        for _ in range(max(1, self.config.callback_burst)):
+            self.post_callback('callback', url, body)
+
+    def send_b2c_result(self, payment, originator_id, conversation_id):
+        result_code, result_desc = self.decide()
+        result = {
+            'ResultType': 0,
+            'ResultCode': result_code,
+            'ResultDesc': result_desc,
+            'OriginatorConversationID': originator_id,
+            'ConversationID': conversation_id,
+            'TransactionID': uuid.uuid4().hex[:10].upper(),
+        }
+        url = self.config.b2c_result_url or payment.get('ResultURL')
+        for _ in range(max(1, self.config.callback_burst)):
+            self.post_callback('b2c_result', url, {'Result': result})
+
+    def post_callback(self, name, url, body):
+        if not url:
+            logger.warning('No callback URL for %s', name)
+            return
+        started = time.monotonic()
+        ok = False
+        try:
+            ok = self.session.post(url, json=body, timeout=10).status_code < 400
+        except requests.RequestException as exc:
+            logger.warning('Callback to %s failed: %s', url, exc)
+        self.metrics.record(name, time.monotonic() - started, ok)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at
+        lines = []
+        for name, stats in sorted(self.metrics.snapshot().items()):
+            lines.append(
+                f"{name}: {stats['calls']} ({stats['calls'] / elapsed:.1f}/s), "
+                f"{stats['errors']} errors, avg {stats['avg_ms']}ms, p95 {stats['p95_ms']}ms"
+            )
+        return lines
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    simulator = None
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def reply(self, status_code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def dispatch(self, name, handler):
+        started = time.monotonic()
+        simulator = self.simulator
+        if simulator.config.latency:
+            time.sleep(simulator.config.latency)
+        if random.random() < simulator.config.error_rate:
+            status_code, payload = 503, {'errorMessage': 'Service Unavailable'}
+        else:
+            status_code, payload = handler()
+        self.reply(status_code, payload)
+        simulator.metrics.record(name, time.monotonic() - started, status_code < 400)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        if self.path.startswith('/oauth/v1/generate'):
+            self.dispatch('oauth', lambda: (200, self.simulator.issue_token()))
+        else:
+            self.reply(404, {'errorMessage': 'Not Found'})
+
+    def do_POST(self):
+        routes = {
+            '/mpesa/stkpush/v1/processrequest': ('stk_push', self.simulator.stk_push),
+            '/mpesa/stkpushquery/v1/query': ('stk_query', self.simulator.stk_query),
+            '/mpesa/b2c/v3/paymentrequest': ('b2c', self.simulator.b2c_payment),
+        }
+        route = routes.get(self.path)
+        payload = self.read_json()
+        if route is None:
+            return self.reply(404, {'errorMessage': 'Not Found'})
+        if not self.simulator.authorized(self.headers.get('Authorization')):
+            return self.reply(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+        if payload is None:
+            return self.reply(400, {'errorMessage': 'Bad Request - Invalid JSON'})
+        name, handler = route
+
+        def handle():
+            result = handler(payload)
+            return result if isinstance(result, tuple) else (200, result)
+        self.dispatch(name, handle)
+
+
+def make_server(host, port, config):
+    simulator = DarajaSimulator(config)
+    handler = type('BoundSimulatorHandler', (SimulatorHandler,), {'simulator': simulator})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, simulator
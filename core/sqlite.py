@@ -0,0 +1,30 @@
+"""
+Opt-in SQLite tuning for single-node deployments.
+
+With SQLITE_PRAGMAS set (SQLITE_TUNED=1), every new SQLite connection runs
+the configured PRAGMAs: WAL journaling so readers never wait for a writer,
+synchronous=NORMAL (durable at each WAL checkpoint), a larger page cache,
+memory-mapped reads, in-memory temp tables and a busy timeout. WAL files are
+checkpointed and space is reclaimed by ``manage.py sqlite_maintenance``.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def apply_pragmas(cursor, pragmas):
+    for statement in pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if not pragmas or connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
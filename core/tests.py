@@ -1,3 +1,634 @@
-from django.test import TestCase
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-# Create your tests here.
+import jwt
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+
+from . import ledger
+from .models import Message, PaymentRequest, Task, Transaction, User, Wallet
+from .mpesa import DarajaError, RateLimiter
+
+
+def ledger_total(wallet, transaction_type):
+    total = wallet.transactions.filter(transaction_type=transaction_type).aggregate(total=Sum('amount'))
+    return total['total'] or Decimal('0.00')
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='ledger@example.com', password='pw')
+        self.wallet = self.user.wallet
+
+    def test_to_amount_rounds_to_cents_without_float_error(self):
+        self.assertEqual(ledger.to_amount(0.1 + 0.2), Decimal('0.30'))
+        self.assertEqual(ledger.to_amount('10.005'), Decimal('10.01'))
+        for bad in ('abc', '-5', '0', 'NaN', None):
+            with self.assertRaises(ledger.InvalidAmount):
+                ledger.to_amount(bad)
+
+    def test_debit_never_overdraws(self):
+        ledger.credit(self.wallet, '100.00', 'Top up')
+        ledger.debit(self.wallet, '60.00', 'Withdrawal')
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.debit(self.wallet, '60.00', 'Withdrawal')
+        self.assertEqual(self.wallet.balance, Decimal('40.00'))
+        self.assertEqual(Transaction.objects.filter(wallet=self.wallet).count(), 2)
+
+    def test_hold_capture_and_release(self):
+        ledger.credit(self.wallet, '100.00', 'Top up')
+        captured = ledger.hold(self.wallet, '30.00', 'Payout')
+        released = ledger.hold(self.wallet, '20.00', 'Payout')
+        self.assertEqual((self.wallet.balance, self.wallet.held), (Decimal('50.00'), Decimal('50.00')))
+
+        ledger.capture(captured)
+        ledger.release(released)
+        with self.assertRaises(ledger.HoldNotOpen):
+            ledger.release(captured)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.balance, self.wallet.held), (Decimal('70.00'), Decimal('0.00')))
+        self.assertEqual(
+            self.wallet.balance + self.wallet.held,
+            ledger_total(self.wallet, 'credit') - ledger_total(self.wallet, 'debit')
+        )
+
+
+class ConcurrentWithdrawalTests(TransactionTestCase):
+    WORKERS = 16
+    WITHDRAWALS = 300
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Worker threads need a file-backed test database.')
+        self.user = User.objects.create_user(email='stress@example.com', password='pw')
+        self.wallet = self.user.wallet
+        # Enough for two thirds of the withdrawals to succeed
+        ledger.credit(self.wallet, Decimal('7.00') * 200, 'Top up')
+
+    def test_balance_matches_ledger_under_concurrent_withdrawals(self):
+        start = threading.Barrier(self.WORKERS)
+        outcomes = []
+
+        def withdraw(index):
+            if index < self.WORKERS:
+                start.wait()
+            wallet = Wallet.objects.get(pk=self.wallet.pk)
+            try:
+                ledger.debit(wallet, '7.00', 'Withdrawal request')
+                return True
+            except ledger.InsufficientFunds:
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            outcomes = list(pool.map(withdraw, range(self.WITHDRAWALS)))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(outcomes.count(True), 200)
+        self.assertEqual(self.wallet.balance, Decimal('0.00'))
+        self.assertEqual(
+            self.wallet.balance,
+            ledger_total(self.wallet, 'credit') - ledger_total(self.wallet, 'debit')
+        )
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.user = User.objects.create_user(email='retry@example.com', password='pw', phone_number='0712345678')
+        ledger.credit(self.user.wallet, '5000.00', 'Top up')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def withdraw(self, amount, key):
+        return self.client.post('/api/wallet/withdraw/', {'amount': amount}, format='json',
+                                headers={'Idempotency-Key': key})
+
+    def test_replay_returns_stored_response_without_second_debit(self):
+        first = self.withdraw('2500', 'abc')
+        replay = self.withdraw('2500', 'abc')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.user.payouts.count(), 1)
+        self.user.wallet.refresh_from_db()
+        self.assertEqual(self.user.wallet.held, Decimal('2500.00'))
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.withdraw('2500', 'abc')
+        self.assertEqual(self.withdraw('2600', 'abc').status_code, 422)
+
+    def test_abandoned_key_can_be_taken_over_after_its_lease(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .idempotency import _fingerprint
+        from .models import IdempotencyKey
+
+        # As left behind by a worker killed mid-request
+        request = type('Request', (), {'method': 'POST', 'path': '/api/wallet/withdraw/', 'data': {'amount': '2500'}})
+        record = IdempotencyKey.objects.create(
+            user=self.user, key='abc', fingerprint=_fingerprint(request),
+            expires_at=timezone.now() + timedelta(days=1), locked_until=timezone.now() + timedelta(seconds=30)
+        )
+        self.assertEqual(self.withdraw('2500', 'abc').status_code, 409)
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.withdraw('2500', 'abc').status_code, 200)
+        self.assertEqual(self.user.payouts.count(), 1)
+
+
+class PayoutSettlementTests(TestCase):
+    def setUp(self):
+        from . import payouts
+
+        self.payouts = payouts
+        self.user = User.objects.create_user(email='payout@example.com', password='pw')
+        self.wallet = self.user.wallet
+        ledger.credit(self.wallet, '5000.00', 'Top up')
+
+    def test_success_captures_and_failure_releases_the_hold(self):
+        paid = self.payouts.request_payout(self.wallet, '3000', '254712345678')
+        failed = self.payouts.request_payout(self.wallet, '2000', '254712345678')
+        self.user.payouts.update(status='sent')
+        self.assertTrue(self.payouts.settle(paid.originator_conversation_id, 0, 'ok', 'TX1'))
+        self.assertTrue(self.payouts.settle(failed.originator_conversation_id, 2001, 'Invalid initiator'))
+        # A replayed result changes nothing
+        self.assertFalse(self.payouts.settle(failed.originator_conversation_id, 0, 'ok'))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.balance, self.wallet.held), (Decimal('2000.00'), Decimal('0.00')))
+        self.assertEqual(ledger_total(self.wallet, 'debit'), Decimal('3000.00'))
+
+    def test_payout_amount_is_whole_shillings(self):
+        with self.assertRaises(ledger.InvalidAmount):
+            self.payouts.request_payout(self.wallet, '2500.50', '254712345678')
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.held, Decimal('0.00'))
+
+
+class PayoutDispatchTests(TransactionTestCase):
+    def setUp(self):
+        from . import payouts
+
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Dispatch threads need a file-backed test database.')
+        self.payouts = payouts
+        self.user = User.objects.create_user(email='dispatch@example.com', password='pw')
+        self.wallet = self.user.wallet
+        ledger.credit(self.wallet, '5000.00', 'Top up')
+
+    def test_server_error_keeps_the_hold_and_rejection_releases_it(self):
+        class FakeClient:
+            def __init__(self, status_code):
+                self.status_code = status_code
+
+            def b2c_payment(self, *args, **kwargs):
+                raise DarajaError('Daraja b2c failed', status_code=self.status_code)
+
+        ambiguous = self.payouts.request_payout(self.wallet, '3000', '254712345678')
+        self.assertEqual(self.payouts.process_batch(10, 1, RateLimiter(0), client=FakeClient(502)), (1, 0))
+        ambiguous.refresh_from_db()
+        self.assertEqual(ambiguous.status, 'processing')
+        # Daraja did take it after all: the late result still settles the payout
+        self.assertTrue(self.payouts.settle(ambiguous.originator_conversation_id, 0, 'ok', 'TX1'))
+
+        rejected = self.payouts.request_payout(self.wallet, '2000', '254712345678')
+        self.payouts.process_batch(10, 1, RateLimiter(0), client=FakeClient(400))
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.status, 'failed')
+
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.balance, self.wallet.held), (Decimal('2000.00'), Decimal('0.00')))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='search@example.com', password='pw')
+
+    def task(self, title, description='Details', category='web'):
+        return Task.objects.create(title=title, description=description, category=category,
+                                   budget=100, posted_by=self.user)
+
+    def test_title_matches_rank_above_description_matches(self):
+        from .search import search_task_ids
+
+        in_description = self.task('Landing page', 'Needs some python glue')
+        in_title = self.task('Python scraper')
+        self.task('Logo design')
+        self.assertEqual(search_task_ids('python', 10), [in_title.pk, in_description.pk])
+        # Prefix matches, and the index follows edits and deletes
+        self.assertEqual(search_task_ids('scrap', 10), [in_title.pk])
+        in_title.title = 'Go scraper'
+        in_title.save()
+        in_description.delete()
+        self.assertEqual(search_task_ids('python', 10), [])
+
+    def test_filters_apply_before_the_page_window(self):
+        from .facets import filter_tasks
+        from .search import search_tasks
+
+        for i in range(30):
+            self.task(f'Python job {i}', category='web' if i % 3 == 0 else 'data')
+        web = filter_tasks(Task.objects.all(), {'category': 'web'})
+        first, second = search_tasks('python', 6, 0, queryset=web), search_tasks('python', 6, 6, queryset=web)
+        self.assertEqual((len(first), len(second)), (6, 4))
+        self.assertEqual({t.category for t in first + second}, {'web'})
+
+
+class MessageListTests(TestCase):
+    def test_first_page_holds_the_newest_messages(self):
+        from rest_framework.test import APIClient
+
+        me = User.objects.create_user(email='me@example.com', password='pw')
+        other = User.objects.create_user(email='other@example.com', password='pw')
+        sent = [Message.objects.create(sender=me, receiver=other, content=f'#{i}') for i in range(25)]
+        client = APIClient()
+        client.force_authenticate(me)
+
+        page = client.get('/api/messages/').json()
+        self.assertEqual(page['results'][0]['id'], sent[-1].id)
+        self.assertEqual(len(page['results']), 20)
+        rest = client.get(page['next']).json()
+        self.assertEqual([m['id'] for m in rest['results']], [m.id for m in reversed(sent[:5])])
+
+
+class BootstrapTests(TestCase):
+    def test_task_page_links_to_the_task_list(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+
+        cache.clear()
+        user = User.objects.create_user(email='boot@example.com', password='pw', is_activated=True)
+        for i in range(25):
+            Task.objects.create(title=f'Task {i}', description='d', category='web', budget=10, posted_by=user)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        tasks = client.get('/api/bootstrap/').json()['tasks']
+        self.assertTrue(tasks['next'].startswith('http://testserver/api/tasks/?cursor='))
+        self.assertEqual(len(client.get(tasks['next']).json()['results']), 5)
+
+
+class UsernameAllocationTests(TestCase):
+    def test_next_suffix_is_above_every_numeric_suffix(self):
+        for username in ('john', 'john_9', 'john_10', 'john_007', 'johnny_99', 'john_3000000000'):
+            User.objects.create_user(email=f'{username}@example.org', username=username, password='pw')
+        self.assertEqual(User.objects.allocate_username('john'), 'john_11')
+        self.assertEqual(User.objects.create_user(email='john@example.com').username, 'john_11')
+        self.assertEqual(User.objects.allocate_username('mary'), 'mary')
+
+
+class IdTokenVerifierTests(TestCase):
+    PROJECT = 'freelancer-ke'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from datetime import datetime, timedelta, timezone
+
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'test')])
+        now = datetime.now(timezone.utc)
+        certificate = (
+            x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(cls.private_key.public_key()).serial_number(1)
+            .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+            .sign(cls.private_key, hashes.SHA256())
+        )
+        cls.certificates = {'key-1': certificate.public_bytes(serialization.Encoding.PEM).decode()}
+
+    def setUp(self):
+        from .firebase import IdTokenVerifier
+
+        self.fetches = 0
+
+        def fetch_keys():
+            self.fetches += 1
+            return self.certificates, 3600
+        self.verifier = IdTokenVerifier(self.PROJECT, key_fetcher=fetch_keys)
+
+    def token(self, **overrides):
+        now = int(time.time())
+        claims = {
+            'iss': f'https://securetoken.google.com/{self.PROJECT}', 'aud': self.PROJECT,
+            'sub': 'firebase-uid', 'iat': now, 'exp': now + 3600, 'email': 'fb@example.com',
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': 'key-1'})
+
+    def test_valid_token_is_verified_once_and_then_cached(self):
+        token = self.token()
+        self.assertEqual(self.verifier.verify(token)['uid'], 'firebase-uid')
+        self.assertEqual(self.verifier.verify(token)['email'], 'fb@example.com')
+        self.assertEqual(self.fetches, 1)
+
+    def test_expired_and_wrong_audience_tokens_are_rejected(self):
+        from .firebase import InvalidIdToken
+
+        expired = self.token(iat=int(time.time()) - 7200, exp=int(time.time()) - 3600)
+        for token in (expired, self.token(aud='another-project')):
+            with self.assertRaises(InvalidIdToken):
+                self.verifier.verify(token)
+
+
+class FacetCountTests(TestCase):
+    def test_counters_follow_creates_moves_and_deletes(self):
+        from .facets import facet_counts
+
+        user = User.objects.create_user(email='facets@example.com', password='pw')
+        first = Task.objects.create(title='A', description='d', category='web', location='Nairobi',
+                                    budget=100, posted_by=user)
+        Task.objects.create(title='B', description='d', category='web', location='Mombasa',
+                            budget=100, posted_by=user)
+        self.assertEqual(facet_counts()['category'], {'web': 2})
+
+        first.category = 'design'
+        first.save()
+        self.assertEqual(facet_counts()['category'], {'design': 1, 'web': 1})
+
+        first.delete()
+        self.assertEqual(facet_counts(), {'category': {'web': 1}, 'location': {'Mombasa': 1}})
+
+
+class TaskCatalogueCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+
+        cache.clear()
+        self.user = User.objects.create_user(email='cache@example.com', password='pw', is_activated=True)
+        self.task = Task.objects.create(title='A', description='d', category='web', budget=100, posted_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_catalogue_is_a_304_until_a_task_changes(self):
+        first = self.client.get('/api/tasks/')
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get('/api/tasks/', headers={'If-None-Match': etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(title='B', description='d', category='web', budget=100, posted_by=self.user)
+        changed = self.client.get('/api/tasks/', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(len(changed.json()['results']), 2)
+
+    def test_bookmark_refreshes_the_users_pages(self):
+        from .models import Bookmark
+
+        etag = self.client.get('/api/tasks/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Bookmark.objects.create(user=self.user, task=self.task)
+        page = self.client.get('/api/tasks/', headers={'If-None-Match': etag})
+        self.assertEqual(page.status_code, 200)
+        self.assertTrue(page.json()['results'][0]['is_bookmarked'])
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.me = User.objects.create_user(email='thread-me@example.com', password='pw')
+        self.alice = User.objects.create_user(email='thread-alice@example.com', password='pw')
+        self.bob = User.objects.create_user(email='thread-bob@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_messages_in_both_directions_share_one_thread(self):
+        from .models import Conversation
+
+        Message.objects.create(sender=self.me, receiver=self.alice, content='Hi')
+        reply = Message.objects.create(sender=self.alice, receiver=self.me, content='Hello')
+        Message.objects.create(sender=self.bob, receiver=self.me, content='Ping')
+        latest = Message.objects.create(sender=self.bob, receiver=self.me, content='Ping again')
+
+        self.assertEqual(Conversation.objects.count(), 2)
+        inbox = self.client.get('/api/conversations/').json()['results']
+        self.assertEqual([c['partner']['id'] for c in inbox], [self.bob.pk, self.alice.pk])
+        self.assertEqual([c['unread_count'] for c in inbox], [2, 1])
+        self.assertEqual(inbox[0]['last_message']['id'], latest.pk)
+        self.assertEqual(inbox[1]['last_message']['id'], reply.pk)
+
+    def test_opening_a_thread_marks_it_read(self):
+        Message.objects.create(sender=self.alice, receiver=self.me, content='Hello')
+        thread = self.client.get(f'/api/conversations/{self.alice.pk}/messages/').json()
+        self.assertEqual([m['content'] for m in thread['results']], ['Hello'])
+        self.assertFalse(Message.objects.filter(receiver=self.me, read=False).exists())
+
+
+class SinceWatermarkTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.user = User.objects.create_user(email='sync@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_since_returns_only_newer_rows_oldest_first(self):
+        from .models import Notification
+
+        seen, *new = [Notification.objects.create(user=self.user, message=f'#{i}') for i in range(3)]
+        results = self.client.get(f'/api/notifications/?since={seen.pk}').json()['results']
+        self.assertEqual([n['id'] for n in results], [n.pk for n in new])
+
+        timestamp = new[-1].created_at.isoformat()
+        self.assertEqual(self.client.get('/api/notifications/', {'since': timestamp}).json()['results'], [])
+
+    def test_bad_watermark_is_rejected(self):
+        self.assertEqual(self.client.get('/api/notifications/?since=yesterday').status_code, 400)
+
+
+class FakeDaraja:
+    """Answers STK queries from ``answers``; anything else is still pending."""
+
+    def __init__(self, answers=None):
+        self.answers = answers or {}
+        self.queried = []
+
+    def stk_query(self, checkout_id):
+        from .mpesa import PENDING_ERROR_CODE
+
+        self.queried.append(checkout_id)
+        if checkout_id in self.answers:
+            result_code, result_desc = self.answers[checkout_id]
+            return {'ResultCode': str(result_code), 'ResultDesc': result_desc}
+        raise DarajaError('pending', status_code=500, payload={'errorCode': PENDING_ERROR_CODE})
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        from . import payments
+
+        self.payments = payments
+        self.user = User.objects.create_user(email='payments@example.com', password='pw')
+
+    def push(self, checkout_id, amount=500, reference='DEPOSIT'):
+        return PaymentRequest.objects.create(
+            user=self.user, phone_number='254712345678', amount=amount, account_reference=reference,
+            description='Test', status='sent', checkout_request_id=checkout_id
+        )
+
+    def callback(self, checkout_id, result_code):
+        self.payments.record_callback({'Body': {'stkCallback': {
+            'CheckoutRequestID': checkout_id, 'ResultCode': result_code, 'ResultDesc': 'Done',
+        }}})
+
+    def test_callback_batch_settles_each_push_once(self):
+        deposit = self.push('ws_CO_1')
+        activation = self.push('ws_CO_2', amount=300, reference=f'ACTIVATE-{self.user.pk}')
+        cancelled = self.push('ws_CO_3')
+        self.callback('ws_CO_1', 0)
+        self.callback('ws_CO_1', 0)  # Daraja replays callbacks
+        self.callback('ws_CO_2', 0)
+        self.callback('ws_CO_3', 1032)
+        self.callback('ws_CO_unknown', 0)
+
+        daraja = FakeDaraja({'ws_CO_1': (0, 'Paid'), 'ws_CO_2': (0, 'Paid')})
+        self.assertEqual(self.payments.process_callbacks(100, client=daraja), 5)
+        self.callback('ws_CO_1', 0)
+        self.assertEqual(self.payments.process_callbacks(100, client=daraja), 1)
+        # Only reported successes of open pushes are confirmed, once each
+        self.assertEqual(sorted(daraja.queried), ['ws_CO_1', 'ws_CO_2'])
+
+        for payment_request in (deposit, activation, cancelled):
+            payment_request.refresh_from_db()
+        self.assertEqual([deposit.status, activation.status, cancelled.status], ['succeeded', 'succeeded', 'failed'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_activated)
+        self.assertEqual(self.user.wallet.balance, Decimal('500.00'))
+        self.assertEqual(ledger_total(self.user.wallet, 'credit'), Decimal('500.00'))
+
+    def test_forged_success_callback_does_not_activate(self):
+        activation = self.push('ws_CO_forged', amount=300, reference=f'ACTIVATE-{self.user.pk}')
+        self.callback('ws_CO_forged', 0)
+        self.payments.process_callbacks(100, client=FakeDaraja())
+        activation.refresh_from_db()
+        self.assertEqual(activation.status, 'sent')  # left for reconcile
+
+        self.callback('ws_CO_forged', 0)
+        self.payments.process_callbacks(100, client=FakeDaraja({'ws_CO_forged': (1032, 'Cancelled')}))
+        activation.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(activation.status, 'failed')
+        self.assertFalse(self.user.is_activated)
+
+    def test_reconcile_applies_answers_and_expires_unanswered_pushes(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        answered, stale, recent = self.push('ws_CO_answered'), self.push('ws_CO_stale'), self.push('ws_CO_recent')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        PaymentRequest.objects.filter(pk__in=[answered.pk, stale.pk]).update(
+            created_at=an_hour_ago, updated_at=an_hour_ago
+        )
+        PaymentRequest.objects.filter(pk=recent.pk).update(updated_at=timezone.now() - timedelta(minutes=2))
+
+        checked, settled = self.payments.reconcile(
+            limit=10, concurrency=2, rate=0, min_age=60, recheck_after=300, expire_after=600,
+            client=FakeDaraja({'ws_CO_answered': (0, 'Paid')})
+        )
+        self.assertEqual((checked, settled), (3, 2))
+        for payment_request in (answered, stale, recent):
+            payment_request.refresh_from_db()
+        self.assertEqual(answered.status, 'succeeded')
+        self.assertEqual((stale.status, stale.result_code), ('failed', self.payments.EXPIRED_RESULT_CODE))
+        self.assertEqual(recent.status, 'sent')
+        self.assertIsNotNone(recent.last_checked_at)
+
+
+class CheckActivationTests(TestCase):
+    def test_reports_the_stored_flag_not_the_authenticated_copy(self):
+        from rest_framework.test import APIClient
+
+        user = User.objects.create_user(email='activate@example.com', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+        # As the payment worker does it: a queryset update, no signals
+        User.objects.filter(pk=user.pk).update(is_activated=True)
+        self.assertEqual(client.get('/api/check-activation/').json(), {'is_activated': True})
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.authtoken.models import Token
+
+        from .authentication import CachedTokenAuthentication, local_cache
+
+        local_cache.clear()
+        cache.clear()
+        self.user = User.objects.create_user(email='auth@example.com', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_second_lookup_is_served_from_cache_without_secrets(self):
+        from .authentication import local_cache
+
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, user.is_activated), (self.user.pk, False))
+        self.assertIn('password', user.get_deferred_fields())
+        cached = [value for _, value in local_cache._data.values()]
+        self.assertNotIn(self.user.password, str(cached))
+
+    def test_saving_the_user_invalidates_the_cached_credentials(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_activated = True
+            self.user.save()
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertTrue(user.is_activated)
+
+    def test_deleted_token_stops_authenticating(self):
+        from rest_framework.exceptions import AuthenticationFailed
+
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.user = User.objects.create_user(email='sparse@example.com', password='pw', first_name='Sam')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_transactions_keep_their_shape_and_honour_fields(self):
+        entry = ledger.credit(self.user.wallet, '25.50', 'Top up')
+        full = self.client.get('/api/wallet/transactions/').json()['results']
+        self.assertEqual(full, [{
+            'id': entry.id, 'type': 'credit', 'description': 'Top up', 'amount': '25.50',
+            'date': entry.created_at.date().isoformat(),
+        }])
+        sparse = self.client.get('/api/wallet/transactions/?fields=amount').json()['results']
+        self.assertEqual(sparse, [{'amount': '25.50'}])
+
+    def test_profile_and_conversations_honour_fields(self):
+        other = User.objects.create_user(email='sparse-other@example.com', password='pw')
+        Message.objects.create(sender=other, receiver=self.user, content='Hi')
+        self.assertEqual(self.client.get('/api/profile/?fields=first_name').json(), {'first_name': 'Sam'})
+        inbox = self.client.get('/api/conversations/?fields=partner,unread_count').json()['results']
+        self.assertEqual(inbox, [{'partner': {
+            'id': other.pk, 'username': other.username, 'first_name': '', 'last_name': '', 'profile_picture': None,
+        }, 'unread_count': 1}])
+        self.assertEqual(self.client.get('/api/conversations/?fields=secret').status_code, 400)
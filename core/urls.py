@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import realtime, views
 
 urlpatterns = [
     path('auth/login/', views.login_view),
@@ -9,19 +9,29 @@ urlpatterns = [
     path('payment/save/', views.save_payment_details),
     path('activate/', views.activate_account),
     path('dashboard/', views.dashboard_view),
+    path('bootstrap/', views.bootstrap_view),
     path('notifications/', views.notifications_view),
-    path('tasks/', views.TaskListView.as_view()),
+    path('tasks/', views.TaskListView.as_view(), name='task-list'),
     path('tasks/<int:pk>/', views.task_detail),
     path('tasks/<int:task_id>/apply/', views.apply_to_task),
     path('tasks/<int:task_id>/bookmark/', views.bookmark_task),
     path('tasks/bookmarked/', views.bookmarked_tasks),
+    path('tasks/recommended/', views.recommended_tasks_view),
     path('messages/', views.messages_view),
+    path('conversations/', views.conversations_view),
+    path('conversations/<int:user_id>/messages/', views.conversation_messages),
     path('check-activation/', views.check_activation),
+    path('health/', views.health_view),
+    path('events/', realtime.events_view),  # Server-Sent Events, served by the ASGI app
     path('mpesa/initiate/', views.initiate_mpesa_payment),
+    path('mpesa/requests/<int:pk>/', views.payment_request_detail),
     path('mpesa/confirmation/', views.mpesa_confirmation),  # Must be public
 
     # =============== WALLET ENDPOINTS (NEW - ADDED BELOW) ===============
     path('wallet/balance/', views.get_wallet_balance),
     path('wallet/transactions/', views.get_transactions),
     path('wallet/withdraw/', views.initiate_withdrawal),
+    path('wallet/payouts/<int:pk>/', views.payout_detail),
+    path('mpesa/b2c/result/', views.mpesa_b2c_result),  # Must be public
+    path('mpesa/b2c/timeout/', views.mpesa_b2c_timeout),  # Must be public
 ]
\ No newline at end of file
@@ -1,26 +1,45 @@
+import hashlib
 import json
+import logging
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
-from .mpesa import lipa_na_mpesa_online
+from . import payments, payouts
 from rest_framework import status, generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.exceptions import PermissionDenied  # ← ADDED
-from django.db import transaction as db_transaction
-from decimal import Decimal
-from .models import Wallet, Transaction
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction as db_transaction
+from decimal import ROUND_FLOOR, Decimal
+from . import ledger
+from .models import Wallet
 from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from .models import User, Task, Application, Bookmark, Message, Notification
+from django.urls import reverse
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import User, Task, Application, Bookmark, Message, Notification, Conversation, PaymentRequest, Payout
+from django.core.cache import cache
+from .authentication import load_user
+from .caching import cached_catalogue_response, catalogue_cache_key
+from .facets import facet_counts, filter_tasks
+from .firebase import verify_id_token
+from .idempotency import idempotent
+from .pagination import filter_since, paginate, paginate_ranked
+from .realtime import long_poll
+from .recommendations import recommended_tasks
+from .search import search_tasks
 from .serializers import (
     RegisterSerializer, UserSerializer, ProfileUpdateSerializer,
     PaymentDetailsSerializer, TaskSerializer, ApplicationSerializer,
-    BookmarkSerializer, MessageSerializer, NotificationSerializer
+    BookmarkSerializer, MessageSerializer, ConversationSerializer,
+    TASK_VALUES, MESSAGE_VALUES, NOTIFICATION_VALUES, TRANSACTION_VALUES, USER_VALUES, requested_fields
 )
 
+logger = logging.getLogger(__name__)
+
 # ------------------ AUTH ------------------
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -41,8 +60,10 @@ def login_view(request):
 def register_view(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
-        token = Token.objects.create(user=user)
+        # User, wallet (create_user_wallet signal) and token commit together
+        with db_transaction.atomic():
+            user = serializer.save()
+            token = Token.objects.create(user=user)
         return Response({
             'token': token.key,
             'user': UserSerializer(user).data
@@ -61,9 +82,7 @@ def firebase_login(request):
         return Response({'error': 'idToken is required'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        import firebase_admin
-        from firebase_admin import auth as firebase_auth
-        decoded_token = firebase_auth.verify_id_token(id_token)
+        decoded_token = verify_id_token(id_token)
         firebase_uid = decoded_token['uid']
         email = decoded_token.get('email')
         name = decoded_token.get('name', '')
@@ -78,38 +97,41 @@ def firebase_login(request):
         if not email:
             return Response({'error': 'Email not provided by provider'}, status=status.HTTP_400_BAD_REQUEST)
 
-        user, created = User.objects.get_or_create(
-            email=email,
-            defaults={
-                'first_name': first_name,
-                'last_name': last_name,
-                'oauth_provider': 'firebase',
-            }
-        )
-
-        if not created and not user.oauth_provider:
-            user.oauth_provider = 'firebase'
-            user.save()
-
-        token, _ = Token.objects.get_or_create(user=user)
+        with db_transaction.atomic():
+            user = User.objects.filter(email__iexact=email).first()
+            if user is None:
+                # create_user allocates a unique username; get_or_create would leave it blank
+                user = User.objects.create_user(
+                    email=email,
+                    first_name=first_name,
+                    last_name=last_name,
+                    oauth_provider='firebase',
+                )
+            elif not user.oauth_provider:
+                user.oauth_provider = 'firebase'
+                user.save()
+
+            token, _ = Token.objects.get_or_create(user=user)
         return Response({
             'token': token.key,
             'user': UserSerializer(user).data
         })
 
-    except Exception as e:
-        print(f"Firebase login error: {str(e)}")
+    except Exception:
+        logger.exception('Firebase login failed')
         return Response({'error': 'Authentication failed'}, status=status.HTTP_400_BAD_REQUEST)
 
 # ------------------ PROFILE ------------------
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def profile_view(request):
-    user = request.user
     if request.method == 'GET':
-        return Response(UserSerializer(user).data)
+        # Only the requested columns are read (authentication defers the rest)
+        selection = USER_VALUES.for_request(request)
+        row = selection.values(User.objects.filter(pk=request.user.pk)).get()
+        return Response(selection([row])[0])
     elif request.method == 'PATCH':
-        serializer = ProfileUpdateSerializer(user, data=request.data, partial=True)
+        serializer = ProfileUpdateSerializer(load_user(request.user), data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -119,7 +141,7 @@ def profile_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def save_payment_details(request):
-    user = request.user
+    user = load_user(request.user)
     serializer = PaymentDetailsSerializer(user, data=request.data)
     if serializer.is_valid():
         serializer.save()
@@ -130,7 +152,7 @@ def save_payment_details(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def activate_account(request):
-    user = request.user
+    user = load_user(request.user)
     if not user.payment_method or not user.payment_identifier:
         return Response(
             {'error': 'Payment details required before activation'},
@@ -144,7 +166,7 @@ def activate_account(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_view(request):
-    user = request.user
+    user = load_user(request.user)
     applications = Application.objects.filter(freelancer=user).count()
     return Response({
         'profile': UserSerializer(user).data,
@@ -153,11 +175,72 @@ def dashboard_view(request):
         'is_activated': user.is_activated
     })
 
+@long_poll('notification')
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def notifications_view(request):
     notifications = request.user.notifications.filter(is_read=False)
-    return Response(NotificationSerializer(notifications, many=True).data)
+    selection = NOTIFICATION_VALUES.for_request(request)
+    if 'since' in request.query_params:
+        # Incremental sync: only rows after the watermark, oldest first
+        notifications = filter_since(notifications, request)
+        return paginate(request, selection.values(notifications), selection, descending=False)
+    return paginate(request, selection.values(notifications), selection)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bootstrap_view(request):
+    """
+    Everything a protected page needs on load, in one response.
+
+    Wallet balance and unread counts come from one query; the first task page
+    comes from the catalogue cache. The ETag covers the whole payload.
+    """
+    user = load_user(request.user)
+    unread_messages = (
+        Message.objects.filter(receiver=OuterRef('pk'), read=False)
+        .order_by().values('receiver').annotate(count=Count('*')).values('count')
+    )
+    unread_notifications = (
+        Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+        .order_by().values('user').annotate(count=Count('*')).values('count')
+    )
+    state = User.objects.filter(pk=user.pk).annotate(
+        wallet_balance=Subquery(Wallet.objects.filter(user=OuterRef('pk')).values('balance')[:1]),
+        unread_messages=Coalesce(Subquery(unread_messages, output_field=IntegerField()), Value(0)),
+        unread_notifications=Coalesce(Subquery(unread_notifications, output_field=IntegerField()), Value(0)),
+    ).values('wallet_balance', 'unread_messages', 'unread_notifications').get()
+
+    data = {
+        'profile': UserSerializer(user).data,
+        'is_activated': user.is_activated,
+        'wallet_balance': str(state['wallet_balance'] or Decimal('0.00')),
+        'unread_messages': state['unread_messages'],
+        'unread_notifications': state['unread_notifications'],
+        'tasks': None,
+    }
+    task_key = task_etag = None
+    if user.is_activated:
+        task_key, task_etag = catalogue_cache_key(request, user, namespace='bootstrap')
+
+    fingerprint = json.dumps([data, task_etag], sort_keys=True, default=str)
+    etag = '"bootstrap-%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    if task_key is not None:
+        tasks = cache.get(task_key)
+        if tasks is None:
+            selection = TASK_VALUES.for_request(request)
+            queryset = selection.values(Task.objects.with_user_state(user))
+            # The next page is served by the task list, not by this endpoint
+            tasks_url = request.build_absolute_uri(reverse('task-list'))
+            if request.GET:
+                tasks_url = f'{tasks_url}?{request.GET.urlencode()}'
+            tasks = paginate(request, queryset, selection, base_url=tasks_url).data
+            cache.set(task_key, tasks, settings.TASK_CATALOGUE_CACHE_TTL)
+        data['tasks'] = tasks
+    return Response(data, headers={'ETag': etag})
 
 # ------------------ TASKS ------------------
 class TaskListView(generics.ListAPIView):
@@ -167,15 +250,43 @@ class TaskListView(generics.ListAPIView):
     def get_queryset(self):
         if not self.request.user.is_activated:
             raise PermissionDenied("Account not activated")  # ← FIXED: Now raises 403
-        return Task.objects.all()
+        queryset = Task.objects.with_user_state(self.request.user)
+        return filter_tasks(queryset, self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_activated:
+            raise PermissionDenied("Account not activated")
+        return cached_catalogue_response(
+            request, lambda: self.build_list(request, *args, **kwargs), user=request.user
+        )
+
+    def build_list(self, request, *args, **kwargs):
+        # Read-optimized path: rows come straight from .values()
+        selection = TASK_VALUES.for_request(request)
+        queryset = selection.values(self.get_queryset())
+        query = request.query_params.get('q', '').strip()
+        if query:
+            # ?q= switches to full-text search, ranked by relevance
+            response = paginate_ranked(
+                request,
+                lambda limit, offset: search_tasks(query, limit, offset, queryset=queryset),
+                selection
+            )
+        else:
+            response = paginate(request, queryset, selection)
+        response.data['facets'] = facet_counts()
+        return response
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def task_detail(request, pk):
     if not request.user.is_activated:
         return Response({'error': 'Account not activated'}, status=status.HTTP_403_FORBIDDEN)
-    task = get_object_or_404(Task, pk=pk)
-    return Response(TaskSerializer(task).data)
+    selection = TASK_VALUES.for_request(request)
+    task = selection.values(Task.objects.with_user_state(request.user)).filter(pk=pk).first()
+    if task is None:
+        return Response({'detail': 'No Task matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(selection([task])[0])
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -196,36 +307,132 @@ def bookmark_task(request, task_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def bookmarked_tasks(request):
-    bookmarks = Bookmark.objects.filter(user=request.user).select_related('task')
-    tasks = [b.task for b in bookmarks]
-    return Response(TaskSerializer(tasks, many=True).data)
+    tasks = Task.objects.filter(bookmark__user=request.user).with_user_state(request.user)
+    selection = TASK_VALUES.for_request(request)
+    return paginate(request, selection.values(tasks), selection)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def recommended_tasks_view(request):
+    if not request.user.is_activated:
+        return Response({'error': 'Account not activated'}, status=status.HTTP_403_FORBIDDEN)
+
+    selection = TASK_VALUES.for_request(request)
+    queryset = selection.values(Task.objects.with_user_state(request.user))
+    return paginate_ranked(
+        request,
+        lambda limit, offset: recommended_tasks(request.user, limit, offset, queryset=queryset),
+        selection
+    )
 
 # ------------------ MESSAGING ------------------
+@long_poll('message')
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def messages_view(request):
     if request.method == 'GET':
         messages = Message.objects.filter(
             Q(sender=request.user) | Q(receiver=request.user)
-        ).order_by('timestamp')
-        return Response(MessageSerializer(messages, many=True).data)
+        )
+        selection = MESSAGE_VALUES.for_request(request)
+        if 'since' in request.query_params:
+            # Incremental sync: only rows after the watermark, oldest first
+            messages = filter_since(messages, request, ordering_field='timestamp')
+            return paginate(
+                request, selection.values(messages), selection,
+                ordering_field='timestamp', descending=False
+            )
+        # Newest first, so the first page holds the latest messages
+        return paginate(request, selection.values(messages), selection, ordering_field='timestamp')
     elif request.method == 'POST':
-        data = request.data.copy()
-        data['sender'] = request.user.id
-        serializer = MessageSerializer(data=data)
+        serializer = MessageSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # sender is read-only on the serializer, so it has to be passed to save()
+            serializer.save(sender=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversations_view(request):
+    unread = (
+        Message.objects.filter(conversation=OuterRef('pk'), receiver=request.user, read=False)
+        .order_by().values('conversation').annotate(count=Count('*')).values('count')
+    )
+    fields = requested_fields(request, ConversationSerializer.Meta.fields)
+    wanted = set(fields or ConversationSerializer.Meta.fields)
+    conversations = Conversation.objects.for_user(request.user).filter(last_message__isnull=False)
+    # Join and count only what the requested fields need
+    related = [name for name, needed in (
+        ('user_low', 'partner' in wanted), ('user_high', 'partner' in wanted),
+        ('last_message', 'last_message' in wanted),
+    ) if needed]
+    if related:
+        conversations = conversations.select_related(*related)
+    if 'unread_count' in wanted:
+        conversations = conversations.annotate(
+            unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0))
+        )
+    return paginate(
+        request, conversations,
+        lambda page: ConversationSerializer(
+            page, many=True, fields=fields, context={'request': request}
+        ).data,
+        ordering_field='updated_at'
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversation_messages(request, user_id):
+    """Messages exchanged with one user, newest first. The first page marks them read."""
+    partner = get_object_or_404(User, pk=user_id)
+    low, high = sorted((request.user.pk, partner.pk))
+    conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+    if conversation is None:
+        return Response({'next': None, 'results': []})
+    selection = MESSAGE_VALUES.for_request(request)
+    if not request.query_params.get('cursor'):
+        conversation.messages.filter(receiver=request.user, read=False).update(read=True)
+    return paginate(
+        request, selection.values(conversation.messages.all()), selection,
+        ordering_field='timestamp'
+    )
+
 # ------------------ UTILITIES ------------------
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def health_view(request):
+    """Liveness/readiness probe: checks the database and cache round trips"""
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        checks['database'] = 'ok'
+    except DatabaseError:
+        # Details go to the log only; this endpoint is public
+        logger.exception('Health check: database unavailable')
+        checks['database'] = 'error'
+    try:
+        cache.set('health:ping', 1, 10)
+        checks['cache'] = 'ok' if cache.get('health:ping') == 1 else 'error'
+    except Exception:
+        logger.exception('Health check: cache unavailable')
+        checks['cache'] = 'error'
+    healthy = all(value == 'ok' for value in checks.values())
+    return Response(checks, status=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_activation(request):
-    return Response({'is_activated': request.user.is_activated})
+    # Polled while the payment worker activates the account, so read the row
+    # rather than the (possibly cached) authenticated user
+    is_activated = User.objects.filter(pk=request.user.pk).values_list('is_activated', flat=True).first()
+    return Response({'is_activated': bool(is_activated)})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def initiate_mpesa_payment(request):
     """Initiate STK Push for KES 300 activation fee"""
     phone = request.data.get('phone_number')
@@ -240,41 +447,33 @@ def initiate_mpesa_payment(request):
     else:
         return Response({'error': 'Phone must start with 0 or 254'}, status=400)
 
-    user = request.user
-    try:
-        response = lipa_na_mpesa_online(
-            phone_number=phone,
-            amount=300,
-            account_reference=f"ACTIVATE-{user.id}",
-            transaction_desc="FreelancerKE Activation Fee"
-        )
-        return Response(response)
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+    # Daraja is called by the process_payment_requests worker, not here
+    payment_request = payments.enqueue_stk_push(
+        user=request.user,
+        phone_number=phone,
+        amount=payments.ACTIVATION_FEE,
+        account_reference=f"ACTIVATE-{request.user.id}",
+        description="FreelancerKE Activation Fee"
+    )
+    return Response(payments.payment_data(payment_request), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def payment_request_detail(request, pk):
+    payment_request = get_object_or_404(PaymentRequest, pk=pk, user=request.user)
+    return Response(payments.payment_data(payment_request))
 
 
 @csrf_exempt
 def mpesa_confirmation(request):
-    """Handle M-Pesa callback"""
+    """Handle M-Pesa callback: store it and acknowledge; the payment worker applies it"""
     if request.method == "POST":
-        data = json.loads(request.body)
-        result = data.get('Body', {}).get('stkCallback', {})
-        checkout_id = result.get('CheckoutRequestID')
-        result_code = result.get('ResultCode')
-
-        if result_code == 0:  # Success
-            # Find user by metadata (you can store mapping in DB or cache)
-            # For simplicity, assume you store {checkout_id: user_id} in cache
-            from django.core.cache import cache
-            user_id = cache.get(f"mpesa_checkout_{checkout_id}")
-            if user_id:
-                try:
-                    user = User.objects.get(id=user_id)
-                    user.is_activated = True
-                    user.save()
-                except User.DoesNotExist:
-                    pass
-
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return HttpResponse("Invalid request", status=400)
+        payments.record_callback(data)
         return HttpResponse("OK")
     return HttpResponse("Invalid request", status=400)
 # =============== WALLET VIEWS (NEW - ADD TO END OF FILE) ===============
@@ -292,19 +491,13 @@ def get_wallet_balance(request):
 @permission_classes([IsAuthenticated])
 def get_transactions(request):
     wallet, created = Wallet.objects.get_or_create(user=request.user)
-    transactions = wallet.transactions.all().order_by('-created_at')[:20]
-    data = [{
-        'id': t.id,
-        'type': t.transaction_type,
-        'description': t.description,
-        'amount': str(t.amount),
-        'date': t.created_at.date().isoformat()
-    } for t in transactions]
-    return Response(data)
+    selection = TRANSACTION_VALUES.for_request(request)
+    return paginate(request, selection.values(wallet.transactions.all()), selection)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def initiate_withdrawal(request):
     try:
         wallet = Wallet.objects.get(user=request.user)
@@ -313,27 +506,54 @@ def initiate_withdrawal(request):
 
     if wallet.balance < 2000:
         return Response({'error': 'Minimum withdrawal is KES 2000'}, status=400)
-    
-    amount = request.data.get('amount')
-    if not amount:
-        amount = float(wallet.balance)
-    else:
-        amount = float(amount)
 
-    if amount > float(wallet.balance):
+    phone = payouts.payout_phone(load_user(request.user))
+    if phone is None:
+        return Response({'error': 'Add your M-Pesa number in payment details first'}, status=400)
+
+    try:
+        # M-Pesa pays whole shillings, so by default withdraw the whole-shilling part
+        amount = request.data.get('amount') or wallet.balance.to_integral_value(rounding=ROUND_FLOOR)
+        payout = payouts.request_payout(wallet, amount, phone)
+    except ledger.InvalidAmount as e:
+        return Response({'error': str(e)}, status=400)
+    except ledger.InsufficientFunds:
         return Response({'error': 'Insufficient balance'}, status=400)
 
-    with db_transaction.atomic():
-        wallet.balance = float(wallet.balance) - amount
-        wallet.save()
-        Transaction.objects.create(
-            wallet=wallet,
-            amount=Decimal(str(amount)),
-            transaction_type='debit',
-            description='Withdrawal request'
-        )
-    
+    # The process_payouts worker sends the money; funds stay held until M-Pesa confirms
     return Response({
         'message': 'Withdrawal initiated',
-        'new_balance': str(wallet.balance)
-    })
\ No newline at end of file
+        'new_balance': str(wallet.balance),
+        'payout': payouts.payout_data(payout)
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def payout_detail(request, pk):
+    payout = get_object_or_404(Payout, pk=pk, user=request.user)
+    return Response(payouts.payout_data(payout))
+
+
+@csrf_exempt
+def mpesa_b2c_result(request):
+    """Handle the M-Pesa B2C result callback"""
+    if request.method != "POST":
+        return HttpResponse("Invalid request", status=400)
+    try:
+        payouts.handle_result(json.loads(request.body))
+    except ValueError:
+        return HttpResponse("Invalid request", status=400)
+    return HttpResponse("OK")
+
+
+@csrf_exempt
+def mpesa_b2c_timeout(request):
+    """Handle the M-Pesa B2C queue timeout callback"""
+    if request.method != "POST":
+        return HttpResponse("Invalid request", status=400)
+    try:
+        payouts.handle_timeout(json.loads(request.body))
+    except ValueError:
+        return HttpResponse("Invalid request", status=400)
+    return HttpResponse("OK")
@@ -16,13 +16,9 @@ const ProtectedRoute = ({ children, requiredStep }) => {
 
         // ✅ api.js automatically attaches token — no need to set headers manually
 
-        // Check activation status
-        const activationRes = await api.get('/api/check-activation/'); // ✅
-        const { is_activated } = activationRes.data;
-
-        // Get user profile to check completion
-        const profileRes = await api.get('/api/profile/'); // ✅
-        const user = profileRes.data;
+        // Activation state and profile in one request
+        const bootstrapRes = await api.get('/api/bootstrap/');
+        const { is_activated, profile: user } = bootstrapRes.data;
 
         // Enforce step-by-step flow
         if (requiredStep === 'profile') {
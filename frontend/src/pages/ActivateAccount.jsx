@@ -41,8 +41,8 @@ export default function ActivateAccount() {
         { headers: { Authorization: `Token ${token}` } }
       );
 
-      if (res.data.CheckoutRequestID) {
-        // Step 2: Poll for activation status (every 3 seconds, up to 60s)
+      if (res.status === 202 && res.data.id) {
+        // Step 2: The STK push is queued; poll for activation (every 3 seconds, up to 60s)
         let attempts = 0;
         const pollActivation = async () => {
           attempts++;
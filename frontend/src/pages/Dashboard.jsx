@@ -26,11 +26,11 @@ export default function Dashboard() {
         ]);
         setUser(profileRes.data);
         setStats({
-          tasks: tasksRes.data.length,
-          messages: messagesRes.data.length,
+          tasks: tasksRes.data.results.length,
+          messages: messagesRes.data.results.length,
           payments: 0
         });
-        setNotifications(notifRes.data);
+        setNotifications(notifRes.data.results);
       } catch (err) {
         console.error('Dashboard load error:', err);
         localStorage.removeItem('token');
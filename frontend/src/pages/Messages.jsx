@@ -17,7 +17,8 @@ export default function Messages() {
           api.get('/api/messages/')      // ✅
         ]);
         setUser(profileRes.data);
-        setMessages(messagesRes.data);
+        // The API pages newest first; show them oldest at the top
+        setMessages([...messagesRes.data.results].reverse());
       } catch (err) {
         console.error('Messages load error:', err);
         // Optionally redirect to login if auth fails
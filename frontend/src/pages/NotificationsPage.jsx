@@ -20,7 +20,7 @@ export default function NotificationsPage() {
     const fetchNotifications = async () => {
       try {
         const res = await api.get('/api/notifications/');
-        setNotifications(res.data.map(n => ({ ...n, dismissed: false })));
+        setNotifications(res.data.results.map(n => ({ ...n, dismissed: false })));
       } catch (err) {
         console.error('Failed to load notifications');
       }
@@ -14,12 +14,9 @@ export default function Tasks() {
   useEffect(() => {
     const loadTasks = async () => {
       try {
-        const [tasksRes, bookmarksRes] = await Promise.all([
-          api.get('/api/tasks/'),
-          api.get('/api/tasks/bookmarked/')
-        ]);
-        setTasks(tasksRes.data);
-        setBookmarked(bookmarksRes.data.map(t => t.id));
+        const tasksRes = await api.get('/api/tasks/');
+        setTasks(tasksRes.data.results);
+        setBookmarked(tasksRes.data.results.filter(t => t.is_bookmarked).map(t => t.id));
       } catch (err) {
         console.error('Tasks load error:', err);
 
@@ -33,7 +33,7 @@ export default function Wallet() {
           axios.get('https://freelancer-8m9p.onrender.com/api/wallet/transactions/')
         ]);
         setBalance(parseFloat(balanceRes.data.balance));
-        setTransactions(txRes.data);
+        setTransactions(txRes.data.results);
         setError(null);
       } catch (err) {
         console.error('Failed to load wallet:', err);